@@ -4,19 +4,70 @@ Daktela Extractor Component main class.
 
 import asyncio
 import csv
+import hashlib
+import io
 import logging
+import os
+import shutil
 import sys
-import traceback
+import threading
+from collections.abc import Coroutine
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, TypeVar
 
-import keboola.utils
+import orjson
 from keboola.component.base import ComponentBase, sync_action
 from keboola.component.exceptions import UserException
 
+try:
+    import uvloop
+except ImportError:  # uvloop does not support Windows
+    uvloop = None
+
 from configuration import Configuration, RowConfiguration
-from daktela_client import DaktelaApiClient
-from extractor import DaktelaExtractor
+from daktela_client import AccessTokenFilter, DaktelaApiClient
+from extractor import ACTIVITIES_ENDPOINTS, DaktelaExtractor, run_all
+
+T = TypeVar("T")
+
+CSV_FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND | getattr(os, "O_CLOEXEC", 0)
+"""Flags for opening output CSV files as raw append-only descriptors."""
+
+MIN_CONNECTION_POOL_SIZE = 20
+"""Lower bound for the HTTP connection pool size."""
+
+DEFAULT_PRIMARY_KEYS = ["name"]
+"""Primary key used for endpoints without a specific default."""
+
+ENDPOINT_PRIMARY_KEYS = {"activitiesCall": ["id_call"]}
+"""Default primary keys for endpoints not keyed by 'name'."""
+
+MAX_MANIFEST_WRITERS = 8
+"""Maximum number of threads writing table manifests."""
+
+CSV_SPECIAL_CHARS = (",", '"', "\r", "\n")
+"""Characters that force csv.writer to quote a field."""
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion on a uvloop event loop, or the default loop without uvloop."""
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
+def format_unquoted_csv(rows: list[list[str]]) -> str | None:
+    """
+    Format rows of string fields as CSV without going through the csv module.
+
+    Returns None if any field needs quoting, in which case the caller must use
+    csv.writer. Output matches csv.writer with the default dialect otherwise.
+    """
+    fields = "".join(["".join(row) for row in rows])
+    if any(char in fields for char in CSV_SPECIAL_CHARS):
+        return None
+    return "".join([",".join(row) + "\r\n" for row in rows])
 
 
 class Component(ComponentBase):
@@ -29,14 +80,27 @@ class Component(ComponentBase):
 
     def __init__(self) -> None:
         super().__init__()
+        for handler in logging.getLogger().handlers:
+            # Components may be constructed repeatedly (tests, sync actions); install the filter once
+            if not any(isinstance(f, AccessTokenFilter) for f in handler.filters):
+                handler.addFilter(AccessTokenFilter())
         self.params: Configuration | None = None
         self.row_configs: list[RowConfiguration] = []
         self._table_definitions: dict[str, Any] = {}
+        self._table_writers: dict[str, tuple[int, io.StringIO, Any, tuple[str, ...]]] = {}
         self._schema_state: dict[str, Any] = {}
+        self._run_timestamp: str | None = None
+        self._token_cache: dict[str, Any] | None = None
+        self._state_hash: bytes | None = None
+        self._table_lock = threading.Lock()
+        self._finalized_tables: list[str] = []
 
     def run(self) -> None:
         """Main execution - orchestrates the component workflow."""
         try:
+            # One timestamp for the whole run, shared by all schema state entries
+            self._run_timestamp = datetime.now(timezone.utc).isoformat()
+
             # Load and validate global configuration
             self.params = self._validate_and_get_configuration()
 
@@ -54,7 +118,13 @@ class Component(ComponentBase):
             self._load_schema_state()
 
             # Run async extraction
-            asyncio.run(self._run_async_extraction())
+            try:
+                run_async(self._run_async_extraction())
+            finally:
+                self._close_all_table_writers()
+
+            # Write manifests for all extracted tables
+            self.finalize_all()
 
             # Save updated schema state
             self._save_schema_state()
@@ -63,26 +133,58 @@ class Component(ComponentBase):
 
         except UserException as err:
             logging.error(f"Configuration/API error: {err}")
-            print(err, file=sys.stderr)
+            print(AccessTokenFilter.mask(str(err)), file=sys.stderr)
             sys.exit(1)
 
         except Exception:
             logging.exception("Unhandled error in component execution")
-            traceback.print_exc(file=sys.stderr)
             sys.exit(2)
 
+    def get_state_file(self) -> dict:
+        """Load the input state file with orjson; returns an empty dict if not present."""
+        state_file_path = os.path.join(self.data_folder_path, "in", "state.json")
+        if not os.path.isfile(state_file_path):
+            logging.info("State file not found. First run?")
+            return {}
+        with open(state_file_path, "rb") as state_file:
+            return orjson.loads(state_file.read())
+
+    def write_state_file(self, state_dict: dict) -> None:
+        """Store the output state file with orjson."""
+        if not isinstance(state_dict, dict):
+            raise TypeError("Dictionary expected as a state file datatype!")
+        with open(os.path.join(self.data_folder_path, "out", "state.json"), "wb") as state_file:
+            state_file.write(
+                orjson.dumps(
+                    state_dict, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                )
+            )
+
     def _load_schema_state(self) -> None:
         """Load schema state from previous runs."""
         state = self.get_state_file()
         self._schema_state = state.get("schema", {})
+        self._token_cache = state.get("auth")
+        self._state_hash = self._hash_state()
         if self._schema_state:
             logging.info(f"Loaded schema state for {len(self._schema_state)} endpoints")
 
     def _save_schema_state(self) -> None:
-        """Save schema state for future runs."""
+        """Save schema state and cached token for future runs, skipping serialization if unchanged."""
+        in_state_path = os.path.join(self.data_folder_path, "in", "state.json")
+        if self._state_hash == self._hash_state() and os.path.isfile(in_state_path):
+            # Carry the previous state over verbatim so it is not lost
+            shutil.copyfile(
+                in_state_path, os.path.join(self.data_folder_path, "out", "state.json")
+            )
+            logging.info("Schema state unchanged, skipping state serialization")
+            return
+
         state = self.get_state_file()
         state["schema"] = self._schema_state
-        state["last_updated"] = datetime.now(timezone.utc).isoformat()
+        if self._token_cache:
+            state["auth"] = self._token_cache
+        state["last_updated"] = self._get_run_timestamp()
         self.write_state_file(state)
         logging.info(f"Saved schema state for {len(self._schema_state)} endpoints")
 
@@ -93,12 +195,54 @@ class Component(ComponentBase):
             return endpoint_schema.get("columns")
         return None
 
-    def update_schema_for_endpoint(self, endpoint: str, columns: list[str]) -> None:
-        """Update stored schema for an endpoint."""
+    def get_api_fields_for_endpoint(self, endpoint: str) -> list[str] | None:
+        """Get stored raw API field names (usable as the fields= parameter) for an endpoint."""
+        endpoint_schema = self._schema_state.get(endpoint)
+        if endpoint_schema:
+            return endpoint_schema.get("fields")
+        return None
+
+    def update_schema_for_endpoint(
+        self,
+        endpoint: str,
+        columns: list[str],
+        fields: list[str] | None = None,
+        ts: str | None = None,
+    ) -> None:
+        """
+        Update stored schema for an endpoint.
+
+        Output columns are stored together with the raw API field names they were
+        produced from, so later runs can request just those fields. Entries are
+        timestamped with the run timestamp by default; an unchanged schema keeps
+        its existing entry and timestamp.
+        """
+        fields = fields or self.get_api_fields_for_endpoint(endpoint)
+        if (
+            self.get_schema_for_endpoint(endpoint) == columns
+            and self.get_api_fields_for_endpoint(endpoint) == fields
+        ):
+            return
+
         self._schema_state[endpoint] = {
             "columns": columns,
-            "last_updated": datetime.now(timezone.utc).isoformat(),
+            "last_updated": ts or self._get_run_timestamp(),
         }
+        if fields:
+            self._schema_state[endpoint]["fields"] = fields
+
+    def _hash_state(self) -> bytes:
+        """Return a stable digest of the persisted state (schema and cached token)."""
+        return hashlib.blake2b(
+            orjson.dumps(
+                {"schema": self._schema_state, "auth": self._token_cache},
+                option=orjson.OPT_SORT_KEYS,
+            )
+        ).digest()
+
+    def _get_run_timestamp(self) -> str:
+        """Return the timestamp of the current run, falling back to now outside of run()."""
+        return self._run_timestamp or datetime.now(timezone.utc).isoformat()
 
     @sync_action("listFields")
     def list_fields(self) -> dict[str, Any]:
@@ -122,14 +266,15 @@ class Component(ComponentBase):
         logging.info(f"Running listFields sync action for endpoint: {row_config.endpoint}")
 
         # Run async field discovery for this endpoint
-        result = asyncio.run(self._discover_fields_async(row_config.endpoint))
+        result = run_async(self._discover_fields_async(row_config.endpoint))
 
         logging.info(f"Discovered {len(result)} fields for {row_config.endpoint}")
         return {row_config.endpoint: result}
 
     async def _discover_fields_async(self, endpoint: str) -> list[str]:
         """Discover available fields for a single endpoint."""
-        async with self._initialize_api_client() as api_client:
+        params = self._require_params()
+        async with self._initialize_api_client(params) as api_client:
             try:
                 fields = await self._get_endpoint_fields(api_client, endpoint)
                 logging.info(f"Discovered {len(fields)} fields for {endpoint}")
@@ -148,24 +293,49 @@ class Component(ComponentBase):
             endpoint=endpoint,
             batch_size=1,
         ):
-            if page and len(page) > 0:
-                # Extract field names from the first record
-                return sorted(page[0].keys())
+            if page:
+                # Extract field names from the first record, in API order
+                return list(page[0])
             break
 
         return []
 
     async def _run_async_extraction(self) -> None:
         """Run the async extraction process for all row configurations."""
-        # Use async context manager for API client (auth happens in __init__)
-        async with self._initialize_api_client() as api_client:
-            # Process each row configuration
+        params = self._require_params()
+
+        # Use async context manager for API client (auth happens in __aenter__)
+        async with self._initialize_api_client(params) as api_client:
+            sem = asyncio.Semaphore(params.advanced.max_concurrent_endpoints)
+
+            async def run_rows(rows: list[tuple[int, RowConfiguration]]) -> None:
+                async with sem:
+                    for idx, row_config in rows:
+                        logging.info(
+                            f"Processing row {idx + 1}/{len(self.row_configs)}: "
+                            f"endpoint={row_config.endpoint}"
+                        )
+                        extractor = self._create_extractor(api_client, row_config, params)
+                        await extractor.extract_all()
+
+            # Rows of different endpoints run concurrently over the shared client, so
+            # their page requests overlap; the client's admission limit and shared
+            # prefetch window keep requests and buffered pages bounded regardless of
+            # how many run. Rows of the same endpoint append to the same output file
+            # one after another; activities rows run after all others.
+            rows_by_endpoint: dict[str, list[tuple[int, RowConfiguration]]] = {}
             for idx, row_config in enumerate(self.row_configs):
-                logging.info(
-                    f"Processing row {idx + 1}/{len(self.row_configs)}: endpoint={row_config.endpoint}"
+                rows_by_endpoint.setdefault(row_config.endpoint, []).append((idx, row_config))
+
+            for activities_phase in (False, True):
+                await run_all(
+                    run_rows(rows)
+                    for endpoint, rows in rows_by_endpoint.items()
+                    if (endpoint in ACTIVITIES_ENDPOINTS) == activities_phase
                 )
-                extractor = self._create_extractor(api_client, row_config)
-                await extractor.extract_all()
+
+            # Keep the (possibly refreshed) token for the next run
+            self._token_cache = api_client.token_cache
 
     def _validate_and_get_configuration(self) -> Configuration:
         """Load and validate global configuration parameters."""
@@ -201,44 +371,35 @@ class Component(ComponentBase):
 
         return row_configs
 
-    def _initialize_api_client(self) -> DaktelaApiClient:
-        """Initialize and return configured API client (authenticates during init)."""
-        params = self._require_params()
+    def _initialize_api_client(self, params: Configuration) -> DaktelaApiClient:
+        """Initialize and return configured API client (authenticates on context entry)."""
         return DaktelaApiClient(
             url=params.connection.url,
             username=params.connection.username,
             password=params.connection.password,
             max_concurrent=params.advanced.max_concurrent_requests,
             verify_ssl=params.connection.verify_ssl,
+            pool_size=max(
+                params.advanced.max_concurrent_requests * 2, MIN_CONNECTION_POOL_SIZE
+            ),
+            cached_token=self._token_cache,
         )
 
     def _create_extractor(
         self,
         api_client: DaktelaApiClient,
         row_config: RowConfiguration,
+        params: Configuration,
     ) -> DaktelaExtractor:
         """Create and configure the extractor for a single row configuration."""
-        params = self._require_params()
-
-        # Parse dates using keboola utils
-        from_datetime = keboola.utils.get_past_date(
-            row_config.date_from
-        ).strftime("%Y-%m-%d %H:%M:%S")
-        to_datetime = keboola.utils.get_past_date(
-            row_config.date_to
-        ).strftime("%Y-%m-%d %H:%M:%S")
-
         # Build table config for this endpoint
         endpoint = row_config.endpoint
         table_configs = {}
 
         # Use primary_key from config if set, otherwise use defaults
-        if row_config.destination.primary_key:
-            primary_keys = row_config.destination.primary_key
-        elif endpoint == "activitiesCall":
-            primary_keys = ["id_call"]
-        else:
-            primary_keys = ["name"]
+        primary_keys = row_config.destination.primary_key or ENDPOINT_PRIMARY_KEYS.get(
+            endpoint, DEFAULT_PRIMARY_KEYS
+        )
 
         table_configs[endpoint] = {"primary_keys": primary_keys}
 
@@ -254,11 +415,13 @@ class Component(ComponentBase):
             url=params.connection.url,
             requested_endpoints=[endpoint],
             batch_size=params.advanced.batch_size,
-            date_from=from_datetime,
-            date_to=to_datetime,
+            date_from=row_config.resolved_date_from,
+            date_to=row_config.resolved_date_to,
             incremental=row_config.destination.incremental,
             max_concurrent_endpoints=params.advanced.max_concurrent_endpoints,
             configured_fields=configured_fields if configured_fields else None,
+            keyset_pagination=params.advanced.keyset_pagination,
+            field_projection=params.advanced.field_projection,
         )
 
     def write_table_data(
@@ -279,65 +442,151 @@ class Component(ComponentBase):
             incremental: Whether to use incremental mode
             columns: List of column names
         """
-        table_definitions = self._get_table_definitions()
+        table_writers = self._get_table_writers()
+
+        # Create table definition and open the output file once on first write.
+        # Writes may run in worker threads, so creation is serialized; each table
+        # is written by a single writer at a time.
+        with self._table_lock:
+            self._open_table_writer(table_name, table_config, columns, incremental)
 
-        # Create table definition on first write
-        if table_name not in table_definitions:
-            out_table = self.create_out_table_definition(
-                table_name,
-                columns=columns,
-                primary_key=table_config.get("primary_keys"),
-                incremental=incremental,
-                has_header=True,
+        if table_name not in table_writers:
+            raise UserException(
+                f"Output file for {table_name} is not open. This should not happen."
             )
 
-            table_definitions[table_name] = out_table
+        # Project records onto the column tuple cached at table creation, serialize
+        # the whole batch in memory, then hand it to the file in one write
+        if records:
+            fd, buffer, writer, cols = table_writers[table_name]
+            rows = [
+                ["" if v is None else v if type(v) is str else str(v) for v in map(record.get, cols)]
+                for record in records
+            ]
+            # Most rows need no quoting; join them directly and only fall back to the
+            # csv writer when a field contains a delimiter, quote or line break
+            text = format_unquoted_csv(rows) if len(cols) > 1 else None
+            if text is None:
+                writer.writerows(rows)
+            else:
+                buffer.write(text)
+            self._flush_csv_buffer(fd, buffer)
 
-            # Write header
-            with open(out_table.full_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=columns)
-                writer.writeheader()
+            logging.info(f"Wrote {len(records)} records to {table_name}")
 
-            logging.info(
-                f"Created table definition for {table_name} with {len(columns)} columns"
-            )
+    def _open_table_writer(
+        self,
+        table_name: str,
+        table_config: dict[str, Any],
+        columns: list[str],
+        incremental: bool,
+    ) -> None:
+        """Create the table definition, open its output file and write the header (once per table)."""
+        table_definitions = self._get_table_definitions()
+        if table_name in table_definitions:
+            return
+
+        out_table = self.create_out_table_definition(
+            table_name,
+            columns=columns,
+            primary_key=table_config.get("primary_keys"),
+            incremental=incremental,
+            has_header=True,
+        )
 
-        # Get table definition
-        out_table = table_definitions.get(table_name)
+        table_definitions[table_name] = out_table
 
-        if not out_table:
-            raise UserException(
-                f"Table definition not found for {table_name}. This should not happen."
-            )
+        fd = os.open(out_table.full_path, CSV_FILE_FLAGS, 0o644)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        self._get_table_writers()[table_name] = (fd, buffer, writer, tuple(columns))
+        self._flush_csv_buffer(fd, buffer)
 
-        # Append records
-        if records:
-            with open(out_table.full_path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
-                for record in records:
-                    # Ensure all columns are present
-                    row = {col: record.get(col) for col in columns}
-                    writer.writerow(row)
+        logging.info(
+            f"Created table definition for {table_name} with {len(columns)} columns"
+        )
 
-            logging.info(f"Wrote {len(records)} records to {table_name}")
+    async def awrite_table_data(
+        self,
+        table_name: str,
+        records: list[dict[str, Any]],
+        table_config: dict[str, Any],
+        columns: list[str],
+        incremental: bool = False,
+    ) -> None:
+        """Run write_table_data in a worker thread so it overlaps with network IO."""
+        await asyncio.to_thread(
+            self.write_table_data,
+            table_name,
+            records,
+            table_config,
+            columns,
+            incremental,
+        )
 
     def finalize_table(self, table_name: str) -> None:
         """
-        Finalize table by writing manifest.
+        Mark table for manifest writing.
+
+        The output file stays open, so further rows of the same endpoint keep
+        appending to it; all files are closed when run() finishes. Manifests are
+        written for all finalized tables at once by finalize_all().
 
         Args:
             table_name: Name of the output table
         """
-        out_table = self._get_table_definitions().get(table_name)
+        if table_name in self._finalized_tables:
+            return
 
-        if out_table:
-            self.write_manifest(out_table)
-            logging.info(f"Wrote manifest for {table_name}")
+        if table_name in self._get_table_definitions():
+            self._finalized_tables.append(table_name)
         else:
             logging.warning(
                 f"No table definition found for {table_name}, skipping manifest"
             )
 
+    def finalize_all(self) -> None:
+        """Write manifests of all finalized tables in parallel."""
+        table_definitions = self._get_table_definitions()
+        out_tables = [table_definitions[name] for name in self._finalized_tables]
+        if not out_tables:
+            return
+
+        with ThreadPoolExecutor(max_workers=MAX_MANIFEST_WRITERS) as executor:
+            list(executor.map(self.write_manifest, out_tables))
+
+        logging.info(f"Wrote manifests for {len(out_tables)} tables")
+        self._finalized_tables.clear()
+
+    def _close_table_writer(self, table_name: str) -> None:
+        """Flush and close the output file of a table if it is open."""
+        table_writer = self._get_table_writers().pop(table_name, None)
+        if table_writer:
+            fd, _, _, _ = table_writer
+            os.close(fd)
+
+    def _close_all_table_writers(self) -> None:
+        """Close all output files that are still open."""
+        for table_name in list(self._get_table_writers()):
+            self._close_table_writer(table_name)
+
+    @staticmethod
+    def _flush_csv_buffer(fd: int, buffer: io.StringIO) -> None:
+        """Encode serialized CSV text from the in-memory buffer and write it to the file descriptor."""
+        data = memoryview(buffer.getvalue().encode("utf-8"))
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+        buffer.seek(0)
+        buffer.truncate()
+
+    def _get_table_writers(self) -> dict[str, tuple[int, io.StringIO, Any, tuple[str, ...]]]:
+        """Return initialized container of open output files and their CSV writers."""
+        if not hasattr(self, "_table_writers"):
+            self._table_writers = {}
+        return self._table_writers
+
     def _get_table_definitions(self) -> dict[str, Any]:
         """Return initialized table definitions container."""
         if not hasattr(self, "_table_definitions"):
@@ -1,5 +1,7 @@
 import logging
+from functools import cached_property
 
+import keboola.utils
 from keboola.component.exceptions import UserException
 from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 
@@ -12,6 +14,7 @@ DEFAULT_MAX_CONCURRENT_ENDPOINTS = (
 DEFAULT_BATCH_SIZE = (
     1000  # Default batch size for processing records before writing to CSV
 )
+API_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # Datetime format used in API date filters
 
 
 class Connection(BaseModel):
@@ -39,11 +42,21 @@ class RowConfiguration(BaseModel):
     fields: list[str] | None = None
     destination: RowDestination = Field(default_factory=RowDestination)
 
+    @cached_property
+    def resolved_date_from(self) -> str:
+        """date_from resolved to an absolute API datetime (parsed once per row)."""
+        return keboola.utils.get_past_date(self.date_from).strftime(API_DATETIME_FORMAT)
+
+    @cached_property
+    def resolved_date_to(self) -> str:
+        """date_to resolved to an absolute API datetime (parsed once per row)."""
+        return keboola.utils.get_past_date(self.date_to).strftime(API_DATETIME_FORMAT)
+
     @classmethod
     def from_dict(cls, data: dict) -> "RowConfiguration":
         """Create RowConfiguration from dict with user-friendly error messages."""
         try:
-            return cls(**data)
+            return cls.model_validate(data)
         except ValidationError as e:
             error_messages = [f"{err['loc'][0]}: {err['msg']}" for err in e.errors()]
             raise UserException(f"Row validation error: {', '.join(error_messages)}")
@@ -55,6 +68,8 @@ class Advanced(BaseModel):
     batch_size: int = DEFAULT_BATCH_SIZE
     max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
     max_concurrent_endpoints: int = DEFAULT_MAX_CONCURRENT_ENDPOINTS
+    keyset_pagination: bool = False
+    field_projection: bool = False
 
     @field_validator("batch_size")
     @classmethod
@@ -83,7 +98,7 @@ class Configuration(BaseModel):
     def from_dict(cls, data: dict) -> "Configuration":
         """Create Configuration from dict with user-friendly error messages."""
         try:
-            return cls(**data)
+            return cls.model_validate(data)
         except ValidationError as e:
             error_messages = [f"{err['loc'][0]}: {err['msg']}" for err in e.errors()]
             raise UserException(f"Validation Error: {', '.join(error_messages)}")
@@ -4,13 +4,18 @@ Retry logic is handled by the Keboola AsyncHttpClient.
 """
 
 import asyncio
+import functools
 import logging
-import warnings
+import random
+import re
+import time
 from collections.abc import AsyncIterator
+from contextlib import aclosing
 from typing import Any
+from urllib.parse import urlencode
 
 import httpx
-import requests
+import orjson
 from keboola.component.exceptions import UserException
 from keboola.http_client import AsyncHttpClient
 
@@ -26,6 +31,41 @@ AUTH_TIMEOUT_SECONDS = 30
 MAX_AUTH_RETRIES = 2
 """Maximum number of authentication retry attempts."""
 
+RETRYABLE_STATUS_CODES = {408, 500, 502, 503, 504}
+"""Transient status codes retried after a backoff; 429 is handled separately."""
+
+MAX_TRANSIENT_RETRIES = 3
+"""Maximum number of retries of a request that failed with a transient error."""
+
+MAX_RATE_LIMIT_RETRIES = 5
+"""Maximum number of retries of a request rejected with 429."""
+
+RETRY_BACKOFF_BASE_SECONDS = 0.5
+"""First retry backoff delay, doubled on each further retry."""
+
+RETRY_BACKOFF_MAX_SECONDS = 30.0
+"""Upper bound for a single retry backoff delay."""
+
+RETRY_JITTER_SECONDS = 1.0
+"""Maximum random delay added to a backoff so concurrent retries spread out."""
+
+TOKEN_TTL_SECONDS = 3600
+"""Assumed access token lifetime; the login response does not state it."""
+
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+"""Cached tokens expiring sooner than this are not reused."""
+
+PREFETCH_WINDOW_FACTOR = 2
+"""Pages scheduled ahead of the consumers of all tables, as a multiple of the current concurrency limit."""
+
+DEFAULT_KEEPALIVE_TIMEOUT_SECONDS = 30.0
+"""How long idle pooled connections are kept open for reuse."""
+
+# Slow pages of 1000 records need a generous read timeout; waiting for a pooled
+# connection is unbounded because the admission controller already limits requests
+REQUEST_TIMEOUT = httpx.Timeout(connect=30.0, read=300.0, write=30.0, pool=None)
+"""Timeouts for data requests, so a hung connection is abandoned and retried."""
+
 # Endpoints that support date filtering via filter[field]=edited
 FILTER_PAGINATED_ENDPOINTS = {"tickets", "contacts"}
 """Endpoints that support filtering on the 'edited' field."""
@@ -39,6 +79,133 @@ ACTIVITIES_FILTER_FIELDS = {
 }
 """Endpoints that should be filtered on a time field, mapped per endpoint."""
 
+DATE_FILTER_FIELDS = {
+    **dict.fromkeys(FILTER_PAGINATED_ENDPOINTS, "edited"),
+    **ACTIVITIES_FILTER_FIELDS,
+}
+"""Date filter field of every endpoint that supports date filtering."""
+
+KEYSET_DEFAULT_FIELD = "name"
+"""Keyset pagination field for endpoints without a date filter (unique per record)."""
+
+
+class KeysetFieldMissing(Exception):
+    """Raised before any keyset page is yielded when records lack the cursor field."""
+
+
+class AccessTokenFilter(logging.Filter):
+    """
+    Mask access token values in log messages and logged tracebacks.
+
+    The token is sent as a query parameter, so it appears in request URLs and
+    parameter dicts that AsyncHttpClient and httpx include in retry logs and errors.
+    """
+
+    TOKEN_PATTERN = re.compile(r"""(accessToken['"]?\s*[:=]\s*['"]?)[^&'"\s,}]+""")
+
+    @classmethod
+    def mask(cls, text: str) -> str:
+        """Replace access token values in text with asterisks."""
+        if "accessToken" not in text:
+            return text
+        return cls.TOKEN_PATTERN.sub(r"\1***", text)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if "accessToken" in message:
+            record.msg = self.mask(message)
+            record.args = None
+        if record.exc_info:
+            # Format the traceback once and drop exc_info, so handlers print the masked text
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.exc_text:
+            record.exc_text = self.mask(record.exc_text)
+        if record.stack_info:
+            record.stack_info = self.mask(record.stack_info)
+        return True
+
+
+class AdmissionController:
+    """
+    Resizable concurrency limiter built on asyncio.Condition.
+
+    Works like a semaphore, but the limit can be changed at runtime (e.g. lowered
+    when the API starts rate limiting) without touching semaphore internals.
+    Lowering the limit never cancels in-flight requests; new ones simply wait
+    until the active count drops below the new limit.
+
+    The limit adapts like TCP congestion control: reduce_limit() halves it at most
+    once per backoff window, and record_success() raises it by one after a full
+    limit's worth of successful requests, up to the initial limit.
+    """
+
+    def __init__(self, limit: int):
+        """
+        Initialize admission controller.
+
+        Args:
+            limit: Maximum number of concurrently admitted requests
+        """
+        self.limit = max(1, limit)
+        self.max_limit = self.limit
+        self.active = 0
+        self._cond = asyncio.Condition()
+        self._successes = 0  # successful requests since the last limit change
+        self._hold_until = 0.0  # monotonic time until which the limit is not changed again
+
+    async def acquire(self) -> None:
+        """Wait until a slot is free and take it."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self) -> None:
+        """Return a slot and wake one waiter."""
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify(1)
+
+    async def reduce_limit(self, hold_seconds: float) -> bool:
+        """
+        Halve the limit unless it was already reduced within the current backoff window.
+
+        Concurrent requests rejected by the same burst therefore lower the limit once.
+
+        Args:
+            hold_seconds: Length of the backoff window; the limit neither drops
+                again nor recovers before it ends
+
+        Returns:
+            Whether the limit was reduced
+        """
+        async with self._cond:
+            now = time.monotonic()
+            if now < self._hold_until:
+                return False
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            self._hold_until = now + hold_seconds
+            return True
+
+    async def record_success(self) -> None:
+        """Count a successful request; raise the limit by one after a limit's worth of them."""
+        if self.limit >= self.max_limit or time.monotonic() < self._hold_until:
+            return
+        async with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit:
+                self._successes = 0
+                self.limit = min(self.max_limit, self.limit + 1)
+                self._cond.notify(1)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
 
 class DaktelaApiClient:
     """Async HTTP client for Daktela API with built-in authentication and pagination."""
@@ -50,9 +217,12 @@ class DaktelaApiClient:
         password: str,
         max_concurrent: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
         verify_ssl: bool = True,
+        pool_size: int | None = None,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT_SECONDS,
+        cached_token: dict[str, Any] | None = None,
     ):
         """
-        Initialize API client and authenticate.
+        Initialize API client. Authentication happens in __aenter__ unless a valid cached token is given.
 
         Args:
             url: Base URL for Daktela API
@@ -60,58 +230,85 @@ class DaktelaApiClient:
             password: Daktela account password
             max_concurrent: Maximum concurrent requests
             verify_ssl: Whether to verify SSL certificates (default: True)
+            pool_size: Maximum pooled connections (default: max_concurrent)
+            keepalive_timeout: Seconds an idle pooled connection is kept alive
+            cached_token: Token cache from a previous run (see token_cache)
         """
         self.url = url
         self.username = username
         self.password = password
         self.max_concurrent = max_concurrent
         self.verify_ssl = verify_ssl
+        self.pool_size = max(pool_size or max_concurrent, max_concurrent)
+        self.keepalive_timeout = keepalive_timeout
         self.client = None  # Will be initialized in __aenter__
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self._http_client: httpx.AsyncClient | None = None  # Pooled client under self.client
+        self.admission = AdmissionController(max_concurrent)
+        self._prefetched_pages = 0  # Pages scheduled by the prefetchers of all tables
         self._token_lock = asyncio.Lock()  # Lock for thread-safe token refresh
         self._token_version = 0  # Track token version to prevent redundant refreshes
+        self.token_expires_at = 0.0
+        self._encoded_token: tuple[str | None, str] = (None, "")  # (token, encoded query)
+
+        # Reuse the token from a previous run if still valid, otherwise authenticate on entry
+        self.access_token: str | None = self._get_valid_cached_token(cached_token)
+        if self.access_token:
+            logging.info("Using cached Daktela access token")
+            self.token_expires_at = cached_token["expires_at"]
+
+    @property
+    def token_cache(self) -> dict[str, Any]:
+        """Return the current access token with its expiry, suitable for the state file."""
+        return {
+            "url": self.url,
+            "username": self.username,
+            "#access_token": self.access_token,
+            "expires_at": self.token_expires_at,
+        }
 
-        # Authenticate synchronously during initialization
-        self.access_token = self._authenticate()
-
-    def _authenticate(self) -> str:
+    def _get_valid_cached_token(self, cached_token: dict[str, Any] | None) -> str | None:
+        """Return cached access token if it belongs to this account and is not about to expire."""
+        if not cached_token:
+            return None
+        if cached_token.get("url") != self.url or cached_token.get("username") != self.username:
+            return None
+        expires_at = cached_token.get("expires_at") or 0
+        if expires_at - time.time() <= TOKEN_EXPIRY_MARGIN_SECONDS:
+            return None
+        return cached_token.get("#access_token")
+
+    async def _authenticate(self) -> str:
         """
         Authenticate with Daktela API and retrieve access token.
 
+        Uses the same pooled HTTP client as data requests, so the login shares
+        its connection with the data requests that follow.
+
         Returns:
             str: Access token for subsequent API requests
 
         Raises:
             UserException: If authentication fails or connection error occurs
         """
-        login_url = f"{self.url}/api/v6/login.json"
         params = {"username": self.username, "password": self.password, "only_token": 1}
 
         try:
             logging.info(f"Attempting to authenticate with Daktela API at {self.url}")
             if not self.verify_ssl:
-                warnings.filterwarnings("ignore", message="Unverified HTTPS request")
                 logging.warning(
                     "SSL verification is disabled for authentication. This is insecure."
                 )
 
-            response = requests.post(
-                login_url,
-                params=params,
-                verify=self.verify_ssl,
-                timeout=AUTH_TIMEOUT_SECONDS,
+            # Go through the pooled httpx client directly: the retrying wrapper logs
+            # request params on failure, which would leak the password
+            response = await self._http_client.post(
+                f"{self.url}/api/v6/login.json", params=params, timeout=AUTH_TIMEOUT_SECONDS
             )
-
-            # Check for successful response
-            if response.status_code != 200:
-                raise UserException(
-                    f"Invalid response from Daktela API. Status code: {response.status_code}. "
-                    f"Response: {response.text[:200]}"
-                )
+            response.raise_for_status()
 
             # Parse response
             try:
-                result = response.json()
+                result = orjson.loads(response.content)
             except Exception as e:
                 raise UserException(
                     f"Failed to parse authentication response: {str(e)}"
@@ -133,18 +330,24 @@ class DaktelaApiClient:
 
             logging.info("Successfully authenticated with Daktela API")
             self._token_version += 1  # Increment version on successful auth
+            self.token_expires_at = time.time() + TOKEN_TTL_SECONDS
 
             return access_token
 
-        except requests.exceptions.ConnectionError as e:
+        except httpx.HTTPStatusError as e:
+            raise UserException(
+                f"Invalid response from Daktela API. Status code: {e.response.status_code}. "
+                f"Response: {e.response.text[:200]}"
+            )
+        except httpx.ConnectError as e:
             raise UserException(
                 f"Server not responding. Failed to connect to {self.url}: {str(e)}"
             )
-        except requests.exceptions.Timeout as e:
+        except httpx.TimeoutException as e:
             raise UserException(
                 f"Connection timeout when connecting to {self.url}: {str(e)}"
             )
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             raise UserException(f"Request failed: {str(e)}")
 
     async def _refresh_token(self, old_version: int) -> None:
@@ -161,13 +364,49 @@ class DaktelaApiClient:
                 return
 
             logging.info("Refreshing access token...")
-            self.access_token = self._authenticate()
+            self.access_token = await self._authenticate()
             logging.info("Access token refreshed successfully")
 
+    async def _create_http_client(self) -> AsyncHttpClient:
+        """
+        Create the AsyncHttpClient wrapper over a pooled HTTP/2 httpx client.
+
+        The wrapper always builds its own httpx.AsyncClient; this is the only place
+        that replaces it. The replacement has a pool sized to the configured
+        concurrency, so connections are reused instead of re-handshaking, HTTP/2 to
+        multiplex concurrent page requests, and REQUEST_TIMEOUT. It takes over the
+        headers and auth the wrapper configured, and the discarded client is closed.
+        """
+        # Retries happen in _get_with_token_refresh, outside the admission slot
+        wrapper = AsyncHttpClient(self.url, retries=0, verify_ssl=self.verify_ssl)
+        default_client = wrapper.client
+        self._http_client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            verify=self.verify_ssl,
+            headers=default_client.headers,
+            auth=default_client.auth,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_timeout,
+            ),
+        )
+        wrapper.client = self._http_client
+        await default_client.aclose()
+        return wrapper
+
     async def __aenter__(self):
         """Async context manager entry."""
-        self.client = AsyncHttpClient(self.url, verify_ssl=self.verify_ssl)
+        self.client = await self._create_http_client()
         await self.client.__aenter__()
+
+        if not self.access_token:
+            try:
+                self.access_token = await self._authenticate()
+            except BaseException:
+                await self.client.__aexit__(None, None, None)
+                raise
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -175,8 +414,10 @@ class DaktelaApiClient:
         if self.client:
             await self.client.__aexit__(exc_type, exc_val, exc_tb)
 
-    def _prepare_endpoint(self, endpoint: str) -> str:
-        """Ensure endpoint includes api prefix and .json suffix."""
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _prepare_endpoint(endpoint: str) -> str:
+        """Ensure endpoint includes api prefix and .json suffix (cached per endpoint)."""
         cleaned = endpoint.lstrip("/")
         if not cleaned.endswith(".json"):
             cleaned = f"{cleaned}.json"
@@ -193,6 +434,7 @@ class DaktelaApiClient:
         batch_size: int = DEFAULT_BATCH_SIZE,
         endpoint: str | None = None,
         fields: list[str] | None = None,
+        keyset_pagination: bool = False,
     ) -> AsyncIterator[list[dict[str, Any]]]:
         """
         Fetch data for a table in pages (generator for memory efficiency).
@@ -230,6 +472,8 @@ class DaktelaApiClient:
             batch_size: Configured batch size, used as API page size when provided.
             endpoint: Optional endpoint override
             fields: Optional list of field names to fetch from the API
+            keyset_pagination: Page by the date filter field, or by name for other
+                endpoints, instead of by offset (see _fetch_keyset_pages)
 
         Yields:
             Pages of records from the API (up to 'page_limit' records per page)
@@ -246,22 +490,16 @@ class DaktelaApiClient:
 
         endpoint_path = self._prepare_endpoint(endpoint or table_name)
         params = {"accessToken": self.access_token}
+        yielded_keyset_page = False
 
         # Add fields parameter if specified
         if fields:
             params["fields"] = ",".join(fields)
 
         # Apply date filtering for supported endpoints
-        if (
-            table_name in FILTER_PAGINATED_ENDPOINTS
-            or table_name in ACTIVITIES_FILTER_FIELDS
-        ):
+        filter_field = DATE_FILTER_FIELDS.get(table_name)
+        if filter_field:
             filters = []
-            if table_name in FILTER_PAGINATED_ENDPOINTS:
-                filter_field = "edited"
-            else:
-                filter_field = ACTIVITIES_FILTER_FIELDS[table_name]
-
             if date_from:
                 filters.append(
                     {"field": filter_field, "operator": "gte", "value": date_from}
@@ -272,62 +510,112 @@ class DaktelaApiClient:
                     {"field": filter_field, "operator": "lte", "value": date_to}
                 )
 
-            if len(filters) == 2:
-                # Both dates: use URL parameter format (not JSON format)
-                # Format: filter[0][field]=edited&filter[0][operator]=gte&filter[0][value]=...
-                #         filter[1][field]=edited&filter[1][operator]=lte&filter[1][value]=...
-                logging.info(f"Date filter for {table_name}: {date_from} to {date_to}")
-                for i, f in enumerate(filters):
-                    params[f"filter[{i}][field]"] = f["field"]
-                    params[f"filter[{i}][operator]"] = f["operator"]
-                    params[f"filter[{i}][value]"] = f["value"]
-            elif len(filters) == 1:
-                # Single date: use simple format
-                f = filters[0]
+            if filters:
                 logging.info(
-                    f"Date filter for {table_name}: {f['field']} {f['operator']} {f['value']}"
+                    f"Date filter for {table_name}: "
+                    + " and ".join(f"{f['field']} {f['operator']} {f['value']}" for f in filters)
                 )
-                params["filter[field]"] = f["field"]
-                params["filter[operator]"] = f["operator"]
-                params["filter[value]"] = f["value"]
+                params.update(self._build_filter_params(filters))
 
-        # First, get total count
-        params_count = params.copy()
-        params_count["skip"] = 0
-        params_count["take"] = 1
+        # Keyset pagination sorts by the date filter field, or by the unique record
+        # name elsewhere; that field must be in every record to advance the cursor
+        keyset_field = filter_field or KEYSET_DEFAULT_FIELD
+        if keyset_pagination and (not fields or keyset_field in fields):
+            try:
+                async with aclosing(
+                    self._fetch_keyset_pages(
+                        endpoint_path,
+                        params,
+                        table_name,
+                        keyset_field,
+                        date_from if filter_field else None,
+                        date_to if filter_field else None,
+                        page_limit,
+                    )
+                ) as pages:
+                    async for page in pages:
+                        yielded_keyset_page = True
+                        yield page
+                return
+            except httpx.HTTPStatusError as exc:
+                # Fall back to offset pagination if the API rejects sorting/filtering
+                if yielded_keyset_page or exc.response.status_code != 400:
+                    raise
+                logging.warning(
+                    f"API rejected keyset pagination for {table_name} (status 400). "
+                    "Falling back to offset pagination."
+                )
+            except KeysetFieldMissing:
+                logging.warning(
+                    f"Records of {table_name} have no '{keyset_field}' field to page by. "
+                    "Falling back to offset pagination."
+                )
+
+        # Fetch the first page; its response also carries the total count
+        params_first = params.copy()
+        params_first["skip"] = 0
+        params_first["take"] = page_limit
 
-        logging.info(f"Fetching total count for table: {table_name}")
+        logging.info(f"Fetching first page and total count for table: {table_name}")
         try:
-            first_response = await self.client.get(endpoint_path, params=params_count)
+            first_page = await self._fetch_first_page(
+                endpoint_path, params_first, table_name
+            )
         except httpx.HTTPStatusError as exc:
             # Some activities sub-endpoints reject filters; retry without filters
             if (
                 exc.response is not None
                 and exc.response.status_code == 400
                 and table_name in ACTIVITIES_FILTER_FIELDS
-                and any(key.startswith("filter[") for key in params_count)
+                and any(key.startswith("filter[") for key in params_first)
             ):
                 logging.warning(
                     "API rejected date filter for %s (status 400). Retrying without filters for this endpoint.",
                     table_name,
                 )
                 params = {"accessToken": self.access_token}
-                params_count = {"accessToken": self.access_token, "skip": 0, "take": 1}
                 # Preserve fields parameter if it was set
                 if fields:
                     params["fields"] = ",".join(fields)
-                    params_count["fields"] = ",".join(fields)
-                first_response = await self.client.get(
-                    endpoint_path, params=params_count
+                params_first = {**params, "skip": 0, "take": page_limit}
+                first_page = await self._fetch_first_page(
+                    endpoint_path, params_first, table_name
                 )
             else:
                 raise
 
-        if not first_response or "result" not in first_response:
+        async with aclosing(
+            self._offset_pages(endpoint_path, params, table_name, first_page, page_limit)
+        ) as pages:
+            async for records in pages:
+                yield records
+
+    async def _offset_pages(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        table_name: str,
+        first_page: tuple[list[dict[str, Any]], int] | None,
+        page_limit: int,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """
+        Yield the already fetched first page, then prefetch the remaining pages by offset.
+
+        Args:
+            endpoint: API endpoint (relative to base URL)
+            params: Query parameters shared by all pages
+            table_name: Name of table (for logging)
+            first_page: Result of _fetch_first_page
+            page_limit: Number of records per page
+
+        Yields:
+            Non-empty pages of records
+        """
+        if first_page is None:
             logging.warning(f"No data found for table: {table_name}")
             return
 
-        total = first_response["result"].get("total", 0)
+        first_records, total = first_page
         logging.info(
             f"Table {table_name}: Total entries: {total}, Batches: {(total + page_limit - 1) // page_limit}"
         )
@@ -335,154 +623,413 @@ class DaktelaApiClient:
         if total == 0:
             return
 
-        # Fetch and yield pages directly without accumulating
-        for offset in range(0, total, page_limit):
-            params_page = params.copy()
-            params_page["skip"] = offset
-            params_page["take"] = page_limit
-
-            records = await self._fetch_page(
-                endpoint_path, params_page, table_name, offset
-            )
+        if first_records:
+            logging.debug("Yielding page of %d records", len(first_records))
+            yield first_records
 
-            if records:
-                logging.debug(f"Yielding page of {len(records)} records")
+        # Close the prefetcher as soon as this generator is closed, so in-flight
+        # pages are cancelled right away rather than whenever it is collected
+        async with aclosing(
+            self._prefetch_pages(endpoint, params, table_name, total, page_limit)
+        ) as pages:
+            async for records in pages:
                 yield records
 
-    async def fetch_table_data(
+    async def _prefetch_pages(
         self,
+        endpoint: str,
+        params: dict[str, Any],
         table_name: str,
-        filters: dict[str, Any],
-        limit: int = DEFAULT_PAGE_LIMIT,
-        endpoint: str | None = None,
-    ) -> list[dict[str, Any]]:
+        total: int,
+        page_limit: int,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
         """
-        Fetch all data for a table with pagination (loads all into memory).
+        Fetch the pages after the first one, prefetching a sliding window concurrently.
 
-        Note: For large datasets, consider using fetch_table_data_batched() instead.
+        The window is shared by all tables extracted concurrently over this client,
+        so concurrent rows do not multiply the pages held in memory; each table may
+        always schedule one page so none of them starves. Pages are yielded as soon as
+        they complete, so one slow page does not stall the rest, and the window is
+        refilled immediately.
 
         Args:
-            table_name: Name of the table to fetch
-            filters: Dictionary of filters to apply
-            limit: Number of records per page
+            endpoint: API endpoint (relative to base URL)
+            params: Query parameters shared by all pages
+            table_name: Name of table (for logging)
+            total: Total number of records reported by the first page
+            page_limit: Number of records per page
 
-        Returns:
-            List of records from the API
+        Yields:
+            Non-empty pages of records
         """
-        # Build endpoint (relative to base URL)
-        endpoint = self._prepare_endpoint(endpoint or table_name)
+        # Encode the static part of the query (fields, filters) once per table;
+        # each page only appends its offset and the current access token
+        base_query = urlencode(
+            {key: value for key, value in params.items() if key != "accessToken"}
+        )
+        offsets = iter(range(page_limit, total, page_limit))
+        pending: set[asyncio.Task[list[dict[str, Any]]]] = set()
+
+        def fill_window() -> None:
+            # The window follows the admission limit, so it shrinks after a 429
+            # instead of queueing pages that could not be requested anyway
+            while not pending or self._prefetched_pages < self.admission.limit * PREFETCH_WINDOW_FACTOR:
+                offset = next(offsets, None)
+                if offset is None:
+                    return
+                query = f"{base_query}&skip={offset}&take={page_limit}".lstrip("&")
+                pending.add(
+                    asyncio.create_task(
+                        self._fetch_page(endpoint, query, table_name, offset)
+                    )
+                )
+                self._prefetched_pages += 1
 
-        # Build query parameters
-        params = {"accessToken": self.access_token}
+        try:
+            fill_window()
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                self._prefetched_pages -= len(done)
+                fill_window()
+
+                for task in done:
+                    records = task.result()
+                    if records:
+                        logging.debug("Yielding page of %d records", len(records))
+                        yield records
+        finally:
+            # Abandoned pages (consumer stopped early or failed) are cancelled,
+            # including any retry backoff, and awaited so none outlive the client
+            if pending:
+                logging.debug(f"Abandoning {len(pending)} in-flight {table_name} pages")
+                self._prefetched_pages -= len(pending)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _fetch_keyset_pages(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        table_name: str,
+        filter_field: str,
+        date_from: str | None,
+        date_to: str | None,
+        page_limit: int,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """
+        Fetch pages sorted by the filter field, advancing a lower bound instead of an offset.
 
-        # Add filters
-        params.update(filters)
+        Each request filters filter_field >= last seen value, so the server never has to
+        skip over already returned rows. Records sharing the boundary value are returned
+        again by the next request and dropped by identity. If a whole page shares one
+        value the cursor cannot advance, so the remainder is fetched by offset within
+        that value's lower bound. Pages are fetched serially, as each depends on the last.
 
-        # First, get total count
-        params_count = params.copy()
-        params_count["skip"] = 0
-        params_count["take"] = 1
+        Args:
+            endpoint: API endpoint (relative to base URL)
+            params: Base query parameters (token, fields, date filter)
+            table_name: Name of table (for logging)
+            filter_field: Field the records are sorted and bounded by
+            date_from: Initial lower bound (inclusive), if any
+            date_to: Upper bound (inclusive), if any
+            page_limit: Number of records per page
 
-        logging.info(f"Fetching total count for table: {table_name}")
-        first_response = await self.client.get(endpoint, params=params_count)
+        Yields:
+            Pages of records in ascending filter_field order
 
-        if not first_response or "result" not in first_response:
-            logging.warning(f"No data found for table: {table_name}")
-            return []
+        Raises:
+            KeysetFieldMissing: If the first full page has no filter_field values
+        """
+        base_params = {
+            key: value for key, value in params.items() if not key.startswith("filter")
+        }
+        base_params["sort"] = filter_field
+        base_params["dir"] = "asc"
+        base_params["take"] = page_limit
+
+        lower = date_from
+        seen_at_lower: set[bytes] = set()
+        previous_page: set[bytes] = set()
+        skip = 0
+        first_request = True
+
+        logging.info(f"Using keyset pagination on '{filter_field}' for table: {table_name}")
+        while True:
+            filters = []
+            if lower:
+                filters.append({"field": filter_field, "operator": "gte", "value": lower})
+            if date_to:
+                filters.append({"field": filter_field, "operator": "lte", "value": date_to})
+            page_params = {**base_params, **self._build_filter_params(filters), "skip": skip}
 
-        total = first_response["result"].get("total", 0)
-        logging.info(
-            f"Table {table_name}: Total entries: {total}, Batches: {(total + limit - 1) // limit}"
-        )
+            records = await self._fetch_page(endpoint, page_params, table_name, skip)
+            identities = [self._record_identity(record) for record in records]
 
-        if total == 0:
-            return []
+            # Only records sharing the boundary value may repeat from the previous
+            # page; anything else means the API ignored the sort or filter, and
+            # the cursor would cycle over the same records
+            if any(i in previous_page and i not in seen_at_lower for i in identities):
+                raise UserException(
+                    f"Keyset pagination failed for {table_name}: the API did not apply "
+                    f"sorting or filtering on '{filter_field}'. Disable keyset pagination."
+                )
+            previous_page = set(identities)
+
+            # Without the cursor field on the first full page the cursor cannot
+            # advance; nothing was yielded yet, so the caller can still page by offset
+            if first_request and len(records) >= page_limit and records[-1].get(filter_field) is None:
+                raise KeysetFieldMissing(filter_field)
+            first_request = False
+
+            new_records = [
+                record
+                for record, identity in zip(records, identities)
+                if record.get(filter_field) != lower or identity not in seen_at_lower
+            ]
+            if new_records:
+                yield new_records
+
+            if len(records) < page_limit:
+                return
+
+            last_value = records[-1].get(filter_field)
+            if last_value is None:
+                raise UserException(
+                    f"Keyset pagination failed for {table_name}: records have no '{filter_field}' value."
+                )
+
+            if last_value == lower:
+                # Whole page shares the boundary value; page through it by offset
+                skip += page_limit
+            else:
+                lower = last_value
+                skip = 0
+                seen_at_lower = set()
+            seen_at_lower.update(
+                identity
+                for record, identity in zip(records, identities)
+                if record.get(filter_field) == lower
+            )
 
-        # Fetch all pages
-        all_records = []
-        tasks = []
+    @staticmethod
+    def _record_identity(record: dict[str, Any]) -> bytes:
+        """Return a value identifying a record for de-duplication across keyset pages."""
+        name = record.get("name")
+        if name is not None:
+            return str(name).encode()
+        return orjson.dumps(record, default=str, option=orjson.OPT_SORT_KEYS)
 
-        for offset in range(0, total, limit):
-            params_page = params.copy()
-            params_page["skip"] = offset
-            params_page["take"] = limit
-            tasks.append(self._fetch_page(endpoint, params_page, table_name, offset))
+    @staticmethod
+    def _build_filter_params(filters: list[dict[str, str]]) -> dict[str, str]:
+        """
+        Build query parameters for a list of filters.
 
-        # Execute all requests concurrently
-        results = await asyncio.gather(*tasks)
+        A single filter uses the simple format filter[field]=...&filter[operator]=...;
+        multiple filters use the indexed format filter[0][field]=...&filter[1][field]=...
+        """
+        if len(filters) == 1:
+            f = filters[0]
+            return {
+                "filter[field]": f["field"],
+                "filter[operator]": f["operator"],
+                "filter[value]": f["value"],
+            }
 
-        # Combine all results
-        for records in results:
-            if records:
-                all_records.extend(records)
+        filter_params = {}
+        for i, f in enumerate(filters):
+            filter_params[f"filter[{i}][field]"] = f["field"]
+            filter_params[f"filter[{i}][operator]"] = f["operator"]
+            filter_params[f"filter[{i}][value]"] = f["value"]
+        return filter_params
 
-        logging.info(f"Table {table_name}: Fetched {len(all_records)} records")
-        return all_records
+    async def _fetch_first_page(
+        self, endpoint: str, params: dict[str, Any], table_name: str
+    ) -> tuple[list[dict[str, Any]], int] | None:
+        """
+        Fetch the first page of a table together with the total record count.
+
+        Args:
+            endpoint: API endpoint (relative to base URL)
+            params: Query parameters (skip/take of the first page)
+            table_name: Name of table (for logging)
+
+        Returns:
+            Tuple of (records, total), or None if the response has no result
+
+        Raises:
+            UserException: If records are reported but 'data' is not a list. The
+                shape is checked once here so later pages can index it directly.
+        """
+        response = await self._get_with_token_refresh(endpoint, params, table_name, 0)
+
+        if not response or "result" not in response:
+            return None
+
+        result = response["result"]
+        data = result.get("data", [])
+        total = result.get("total", 0)
+        if not isinstance(data, list):
+            if total:
+                raise UserException(
+                    f"Unexpected response for {table_name}: 'data' is {type(data).__name__}, not a list."
+                )
+            data = []
+        return data, total
 
     async def _fetch_page(
-        self, endpoint: str, params: dict[str, Any], table_name: str, offset: int
+        self, endpoint: str, params: dict[str, Any] | str, table_name: str, offset: int
     ) -> list[dict[str, Any]]:
         """
-        Fetch a single page of data with concurrency limiting.
+        Fetch a single page of data (concurrency is limited per request attempt).
 
         Args:
             endpoint: API endpoint (relative to base URL)
-            params: Query parameters
+            params: Query parameters, or an already encoded query string
             table_name: Name of table (for logging)
             offset: Offset for this page
 
         Returns:
             List of records from this page
+
+        Raises:
+            UserException: If the response carries no result data; the page lies
+                within the reported total, so skipping it would silently drop records
         """
-        async with self.semaphore:
-            return await self._fetch_page_direct(endpoint, params, table_name, offset)
+        response = await self._get_with_token_refresh(endpoint, params, table_name, offset)
 
-    async def _fetch_page_direct(
-        self, endpoint: str, params: dict[str, Any], table_name: str, offset: int
-    ) -> list[dict[str, Any]]:
+        # The data shape was validated on the first page; index it directly
+        try:
+            return response["result"]["data"]
+        except (KeyError, TypeError):
+            raise UserException(
+                f"Invalid response for {table_name} at offset {offset}: missing 'result.data'."
+            )
+
+    async def _get_with_token_refresh(
+        self, endpoint: str, params: dict[str, Any] | str, table_name: str, offset: int
+    ) -> dict[str, Any]:
         """
-        Fetch a single page of data without concurrency limiting.
+        Perform a GET request with the current access token.
 
-        Automatically refreshes token and retries on 401 errors.
+        Automatically refreshes token and retries on 401 errors (e.g. an expired
+        cached token). On 429 errors the concurrency limit is halved (once per
+        backoff window) and the request is retried after the server's Retry-After
+        delay, or a capped exponential backoff with jitter. Transient errors
+        (RETRYABLE_STATUS_CODES, connection errors and timeouts) are retried after
+        the same backoff; remaining client errors fail immediately. AsyncHttpClient
+        does not retry itself, so each attempt holds an admission slot only while
+        the request is in flight.
 
         Args:
             endpoint: API endpoint (relative to base URL)
-            params: Query parameters
+            params: Query parameters for this request only; its accessToken entry
+                is updated in place to the current token. May also be an already
+                encoded query string without the token, which is then appended.
             table_name: Name of table (for logging)
-            offset: Offset for this page
+            offset: Offset of the requested page (for logging)
 
         Returns:
-            List of records from this page
+            Decoded JSON response
         """
-        for attempt in range(MAX_AUTH_RETRIES):
+        auth_retries = 0
+        rate_limit_retries = 0
+        transient_retries = 0
+        while True:
             # Capture current token version for double-check locking
             token_version = self._token_version
 
-            # Build params with current token
-            current_params = params.copy()
-            current_params["accessToken"] = self.access_token
+            if isinstance(params, str):
+                # Pre-encoded query: skip re-encoding the static parameters
+                url = f"{endpoint}?{params}&{self._token_query()}"
+                request_params = None
+            else:
+                # Callers pass a per-request dict, so the token is set without copying
+                params["accessToken"] = self.access_token
+                url, request_params = endpoint, params
 
             try:
-                logging.debug(f"Fetching {table_name} page at offset {offset}")
-                response = await self.client.get(endpoint, params=current_params)
-
-                if not response or "result" not in response:
-                    return []
-
-                data = response["result"].get("data", [])
-                return data if isinstance(data, list) else []
+                logging.debug("Fetching %s page at offset %d", table_name, offset)
+                # Only the request itself holds an admission slot; token refreshes
+                # and retry backoffs below wait without blocking other requests
+                async with self.admission:
+                    response = await self.client.get_raw(url, params=request_params)
+                await self.admission.record_success()
+                return orjson.loads(response.content)
 
             except httpx.HTTPStatusError as e:
-                if e.response.status_code == 401 and attempt < MAX_AUTH_RETRIES - 1:
+                status_code = e.response.status_code
+                if status_code == 401 and auth_retries < MAX_AUTH_RETRIES - 1:
+                    auth_retries += 1
                     logging.warning(
                         f"Token expired for {table_name} at offset {offset}, refreshing..."
                     )
                     await self._refresh_token(token_version)
                     continue
+                if status_code == 429 and rate_limit_retries < MAX_RATE_LIMIT_RETRIES:
+                    delay = self._rate_limit_delay(e.response, rate_limit_retries)
+                    rate_limit_retries += 1
+                    if await self.admission.reduce_limit(delay):
+                        logging.warning(
+                            f"Rate limited on {table_name} at offset {offset}, lowering "
+                            f"concurrency limit to {self.admission.limit} and retrying in {delay:.1f}s..."
+                        )
+                    else:
+                        logging.warning(
+                            f"Rate limited on {table_name} at offset {offset}, retrying in {delay:.1f}s..."
+                        )
+                    await asyncio.sleep(delay)
+                    continue
+                if status_code in RETRYABLE_STATUS_CODES and transient_retries < MAX_TRANSIENT_RETRIES:
+                    await self._retry_transient(e, table_name, offset, transient_retries)
+                    transient_retries += 1
+                    continue
+                raise
+
+            except httpx.TransportError as e:
+                if transient_retries < MAX_TRANSIENT_RETRIES:
+                    await self._retry_transient(e, table_name, offset, transient_retries)
+                    transient_retries += 1
+                    continue
+                logging.error(f"Error fetching {table_name} at offset {offset}: {e}")
                 raise
 
             except Exception as e:
                 logging.error(f"Error fetching {table_name} at offset {offset}: {e}")
                 raise
 
-        return []
+    def _token_query(self) -> str:
+        """Return the URL-encoded accessToken parameter, re-encoded only when the token changes."""
+        if self._encoded_token[0] != self.access_token:
+            self._encoded_token = (
+                self.access_token,
+                urlencode({"accessToken": self.access_token}),
+            )
+        return self._encoded_token[1]
+
+    async def _retry_transient(self, error: Exception, table_name: str, offset: int, attempt: int) -> None:
+        """Log a transient request failure and wait before its retry."""
+        delay = self._backoff_delay(attempt)
+        logging.warning(
+            f"Transient error fetching {table_name} at offset {offset} ({error}), "
+            f"retrying in {delay:.1f}s..."
+        )
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _rate_limit_delay(response: httpx.Response, attempt: int) -> float:
+        """Return the delay before retrying a 429 response: Retry-After if given, else backoff with jitter."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(RETRY_BACKOFF_MAX_SECONDS, max(0.0, float(retry_after)))
+            except ValueError:
+                pass  # HTTP-date form; fall back to backoff
+        return DaktelaApiClient._backoff_delay(attempt)
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Return a capped exponential backoff with jitter for the given retry attempt."""
+        backoff = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_BASE_SECONDS * 2**attempt)
+        return backoff + random.uniform(0, RETRY_JITTER_SECONDS)
@@ -2,7 +2,9 @@
 
 import asyncio
 import logging
-from typing import TYPE_CHECKING, Any
+from collections.abc import Coroutine, Iterable
+from contextlib import aclosing
+from typing import TYPE_CHECKING, Any, TypeVar
 
 from keboola.component.exceptions import UserException
 
@@ -13,6 +15,37 @@ from transformer import DataTransformer
 if TYPE_CHECKING:
     from component import Component
 
+WRITE_QUEUE_SIZE = 4
+"""Maximum number of record batches waiting to be written per table."""
+
+ACTIVITIES_ENDPOINTS = frozenset(
+    {
+        "activities",
+        "activities_statuses",
+        "activitiesCall",
+        "activitiesChat",
+        "activitiesEmail",
+    }
+)
+"""Activities-related endpoints, extracted after all other endpoints."""
+
+T = TypeVar("T")
+
+
+async def run_all(coros: Iterable[Coroutine[Any, Any, T]]) -> list[T]:
+    """
+    Run coroutines concurrently and return their results in order.
+
+    If one fails, the others are cancelled and its error is raised.
+    """
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(coro) for coro in coros]
+    except ExceptionGroup as group:
+        # Surface the first failure (e.g. a UserException) rather than the group
+        raise group.exceptions[0] from None
+    return [task.result() for task in tasks]
+
 
 class DaktelaExtractor:
     """Main extractor class that orchestrates data extraction."""
@@ -30,6 +63,8 @@ class DaktelaExtractor:
         incremental: bool = False,
         max_concurrent_endpoints: int = DEFAULT_MAX_CONCURRENT_ENDPOINTS,
         configured_fields: dict[str, list[str]] | None = None,
+        keyset_pagination: bool = False,
+        field_projection: bool = False,
     ):
         """
         Initialize extractor.
@@ -46,6 +81,8 @@ class DaktelaExtractor:
             incremental: Whether to use incremental mode
             max_concurrent_endpoints: Maximum number of endpoints to extract concurrently
             configured_fields: User-configured fields per endpoint (optional)
+            keyset_pagination: Use keyset instead of offset pagination where supported
+            field_projection: Request only the API fields stored in state by previous runs
         """
         self.api_client = api_client
         self.table_configs = table_configs
@@ -58,7 +95,10 @@ class DaktelaExtractor:
         self.incremental = incremental
         self.max_concurrent_endpoints = max_concurrent_endpoints
         self.configured_fields = configured_fields or {}
+        self.keyset_pagination = keyset_pagination
+        self.field_projection = field_projection
         self._table_columns: dict[str, list[str]] = {}
+        self._api_fields: dict[str, list[str]] = {}
 
     async def extract_all(self):
         """
@@ -78,19 +118,9 @@ class DaktelaExtractor:
         if not self.requested_endpoints:
             raise UserException("No endpoints specified for extraction")
 
-        # Define activities-related endpoints that need special treatment
-        # These are extracted in phase 2 after all other tables
-        activities_endpoints = {
-            "activities",
-            "activities_statuses",
-            "activitiesCall",
-            "activitiesChat",
-            "activitiesEmail",
-        }
-
         # Phase 1: Extract all tables except activities-related ones
         phase1_endpoints = [
-            ep for ep in self.requested_endpoints if ep not in activities_endpoints
+            ep for ep in self.requested_endpoints if ep not in ACTIVITIES_ENDPOINTS
         ]
         if phase1_endpoints:
             logging.info(
@@ -102,7 +132,7 @@ class DaktelaExtractor:
 
         # Phase 2: Extract activities-related tables
         phase2_endpoints = [
-            ep for ep in self.requested_endpoints if ep in activities_endpoints
+            ep for ep in self.requested_endpoints if ep in ACTIVITIES_ENDPOINTS
         ]
         if phase2_endpoints:
             logging.info(
@@ -120,6 +150,7 @@ class DaktelaExtractor:
 
         This limits the number of endpoints being extracted simultaneously
         to prevent OOM when multiple large tables are extracted at once.
+        If one endpoint fails, the others are cancelled and its error is raised.
 
         Args:
             endpoints: List of endpoint names to extract
@@ -130,7 +161,7 @@ class DaktelaExtractor:
             async with sem:
                 await self._extract_table(endpoint)
 
-        await asyncio.gather(*(run_one(ep) for ep in endpoints))
+        await run_all(run_one(ep) for ep in endpoints)
 
     def _get_table_endpoint(self, table_name: str, table_config: dict[str, Any]) -> str:
         """Return endpoint override for table if configured."""
@@ -142,9 +173,13 @@ class DaktelaExtractor:
 
         Precedence:
         1. User-configured fields (from configuration)
-        2. Schema from state (from previous runs)
+        2. API fields seen in previous runs (from schema state), if field projection is enabled
         3. None (fetch all fields from API)
 
+        Field projection is opt-in: with it enabled, fields added to the API after
+        they were stored are not fetched. Without it every run fetches all fields,
+        which also refreshes the stored field list.
+
         Args:
             table_name: Name of the endpoint/table
 
@@ -160,8 +195,11 @@ class DaktelaExtractor:
                 )
                 return fields
 
-        # 2. Schema from state (previous runs)
-        state_fields = self.component.get_schema_for_endpoint(table_name)
+        # 2. Raw API fields from state (previous runs); output columns are
+        # flattened and renamed, so they cannot be requested from the API
+        state_fields = (
+            self.component.get_api_fields_for_endpoint(table_name) if self.field_projection else None
+        )
         if state_fields:
             logging.info(
                 f"Using schema state fields for {table_name}: {len(state_fields)} fields"
@@ -198,38 +236,54 @@ class DaktelaExtractor:
         # Get fields to fetch using precedence logic
         fields = self._get_fields_for_endpoint(table_name)
 
-        # Fetch and process data in pages
-        total_records = 0
-        async for page in self.api_client.fetch_table_data_batched(
-            table_name=table_name,
-            endpoint=endpoint,
-            date_from=self.date_from,
-            date_to=self.date_to,
-            batch_size=self.batch_size,
-            fields=fields,
-        ):
-            if not page:
-                continue
-
-            # Transform page records one by one and write in small batches
-            write_batch = []
-            for transformed_record in transformer.transform_records(page):
-                write_batch.append(transformed_record)
-
-                # Write in configurable batches to reduce memory footprint
-                if len(write_batch) >= write_batch_size:
-                    total_records += self._write_records(
-                        output_table_name, table_config, write_batch, table_name
-                    )
-                    write_batch = []
+        # CSV writes run on a sibling task so fetching and transforming the next
+        # page overlaps with serializing the previous one; if either side fails,
+        # the other is cancelled, so a failed write stops fetching right away
+        queue: asyncio.Queue[list[dict[str, Any]] | None] = asyncio.Queue(
+            maxsize=WRITE_QUEUE_SIZE
+        )
 
-            # Write remaining records from this page
-            if write_batch:
-                total_records += self._write_records(
-                    output_table_name, table_config, write_batch, table_name
+        async def produce() -> None:
+            # Fetch and process data in pages
+            async with aclosing(
+                self.api_client.fetch_table_data_batched(
+                    table_name=table_name,
+                    endpoint=endpoint,
+                    date_from=self.date_from,
+                    date_to=self.date_to,
+                    batch_size=self.batch_size,
+                    fields=fields,
+                    keyset_pagination=self.keyset_pagination,
                 )
+            ) as pages:
+                async for page in pages:
+                    if not page:
+                        continue
+                    # Remember the full API field set unless the user narrowed it
+                    if table_name not in self._api_fields and not self.configured_fields.get(table_name):
+                        self._api_fields[table_name] = list(page[0])
+
+                    # Transform page records one by one and write in small batches
+                    write_batch = []
+                    for transformed_record in transformer.transform_records(page):
+                        write_batch.append(transformed_record)
+
+                        # Write in configurable batches to reduce memory footprint
+                        if len(write_batch) >= write_batch_size:
+                            await queue.put(write_batch)
+                            write_batch = []
+
+                    # Write remaining records from this page
+                    if write_batch:
+                        await queue.put(write_batch)
+
+            await queue.put(None)
+
+        _, total_records = await run_all(
+            [produce(), self._write_worker(queue, output_table_name, table_config, table_name)]
+        )
 
-        # Finalize table (write manifest)
+        # Finalize table (manifest is written once all tables are done)
         if total_records > 0:
             self.component.finalize_table(output_table_name)
             logging.info(
@@ -238,6 +292,33 @@ class DaktelaExtractor:
         else:
             logging.warning(f"No data found for table: {table_name}")
 
+    async def _write_worker(
+        self,
+        queue: "asyncio.Queue[list[dict[str, Any]] | None]",
+        output_table_name: str,
+        table_config: dict[str, Any],
+        table_name: str,
+    ) -> int:
+        """
+        Consume record batches from the queue and write them until a None sentinel arrives.
+
+        Writes run in a worker thread so CSV serialization does not block the
+        event loop. A failed write raises immediately; the producer runs as a
+        sibling task and is cancelled with it.
+
+        Returns:
+            Total number of records written
+        """
+        total_records = 0
+
+        while True:
+            records = await queue.get()
+            if records is None:
+                return total_records
+            total_records += await self._write_records(
+                output_table_name, table_config, records, table_name
+            )
+
     def _get_columns(self, sample_record: dict[str, Any]) -> list[str]:
         """
         Get ordered list of columns for output.
@@ -248,17 +329,10 @@ class DaktelaExtractor:
         Returns:
             Ordered list of column names
         """
-        # Start with id
-        columns = ["id"]
-
-        # Add all other columns from sample record
-        for key in sample_record.keys():
-            if key not in columns:
-                columns.append(key)
-
-        return columns
+        # Start with id, then all other columns from the sample record in order
+        return ["id", *[key for key in sample_record if key != "id"]]
 
-    def _write_records(
+    async def _write_records(
         self,
         output_table_name: str,
         table_config: dict[str, Any],
@@ -273,10 +347,12 @@ class DaktelaExtractor:
             self._table_columns[output_table_name] = self._get_columns(records[0])
             # Update schema state with discovered columns
             self.component.update_schema_for_endpoint(
-                table_name, self._table_columns[output_table_name]
+                table_name,
+                self._table_columns[output_table_name],
+                fields=self._api_fields.get(table_name),
             )
 
-        self.component.write_table_data(
+        await self.component.awrite_table_data(
             table_name=output_table_name,
             records=records,
             table_config=table_config,
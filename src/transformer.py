@@ -12,13 +12,51 @@ The transformation pipeline ensures data consistency and compatibility with
 Keboola Storage tables.
 """
 
-import logging
-import re
+import itertools
+from collections.abc import Iterable, Iterator
 from typing import Any
 
 from keboola.utils.header_normalizer import DefaultHeaderNormalizer
 
 
+_NO_ID = object()
+"""Placeholder keeping the id column first until the record is known to lack one."""
+
+
+def strip_html_tags(value: str) -> str:
+    """
+    Remove HTML tags from a string in linear time.
+
+    Removes exactly what re.sub(r"<.*?>", "", value) removes: every '<' up to the
+    nearest following '>' on the same line. The regex rescans the rest of the
+    line for each unclosed '<', which is quadratic on malformed markup.
+    """
+    parts = []
+    copied = 0  # end of the text already copied to parts
+    search = 0
+    close = -1
+    while True:
+        start = value.find("<", search)
+        if start < 0:
+            break
+        if close < start:
+            close = value.find(">", start)
+            if close < 0:
+                break
+        newline = value.find("\n", start, close)
+        if newline >= 0:
+            # The line ends before the next '>', so no '<' on it starts a tag
+            search = newline + 1
+            continue
+        parts.append(value[copied:start])
+        copied = search = close + 1
+
+    if not parts:
+        return value
+    parts.append(value[copied:])
+    return "".join(parts)
+
+
 class DataTransformer:
     """Transforms raw API data into structured CSV-ready format."""
 
@@ -36,10 +74,13 @@ class DataTransformer:
         self.list_columns = table_config.get("list_columns", [])
         self.list_of_dicts_columns = table_config.get("list_of_dicts_columns", [])
         self.header_normalizer = DefaultHeaderNormalizer()
+        self.key_columns = self.primary_keys + self.secondary_keys
+        self._explodes_lists = bool(self.list_columns or self.list_of_dicts_columns)
+        self._column_names: dict[str, str] = {}  # flattened API key -> sanitized column
 
-    def transform_records(self, records: list[dict[str, Any]]):
+    def transform_records(self, records: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
         """
-        Transform list of API records into CSV-ready format (generator).
+        Transform API records into CSV-ready format (generator).
 
         This method applies a transformation pipeline with the following steps:
         1. Flatten nested JSON structures
@@ -49,15 +90,17 @@ class DataTransformer:
         5. Add required output columns (id)
 
         Args:
-            records: List of raw API records
+            records: Raw API records (any iterable, consumed lazily)
 
         Yields:
             Transformed records ready for CSV output
         """
-        input_count = len(records)
-        output_count = 0
-
         for record in records:
+            if not self._explodes_lists:
+                # Without list columns every record is one row, built in a single walk
+                yield self._transform_flat_record(record)
+                continue
+
             # Step 1: Flatten nested JSON (up to 2 levels deep)
             flattened = self._flatten_json(record)
 
@@ -75,12 +118,59 @@ class DataTransformer:
                 # Step 5: Add required output columns (id)
                 final_row = self._add_output_columns(sanitized)
 
-                output_count += 1
                 yield final_row
 
-        logging.info(
-            f"Transformed {input_count} records into {output_count} rows for table {self.table_name}"
-        )
+    def _transform_flat_record(self, record: dict[str, Any]) -> dict[str, Any]:
+        """
+        Run all transformation steps on a record of a table without list columns.
+
+        Flattening and HTML cleaning happen in one walk; sanitized column names are
+        cached per table, and the output row is built directly with the id column
+        first. The result equals the step-by-step pipeline.
+
+        Args:
+            record: Raw API record
+
+        Returns:
+            Transformed record ready for CSV output
+        """
+        flattened: dict[str, Any] = {}
+        self._flatten_clean_into(flattened, record, "", 0)
+
+        column_names = self._column_names
+        row: dict[str, Any] = {"id": _NO_ID}
+        for key, value in flattened.items():
+            column = column_names.get(key)
+            row[self._cache_column_name(key) if column is None else column] = value
+
+        # A record's own id column wins over the generated one, as in _add_output_columns
+        if row["id"] is _NO_ID:
+            id_parts = []
+            for key in self.key_columns:
+                value = row.get(key)
+                if value is not None and value is not _NO_ID:
+                    id_parts.append(str(value))
+            row["id"] = "_".join(id_parts)
+
+        return row
+
+    def _flatten_clean_into(
+        self, items: dict[str, Any], data: dict[str, Any], parent_key: str, level: int
+    ) -> None:
+        """Flatten data into items (up to 2 levels) like _flatten_json, cleaning strings like _clean_html."""
+        for key, value in data.items():
+            new_key = f"{parent_key}_{key}" if parent_key else key
+
+            if isinstance(value, dict) and level < 2:
+                self._flatten_clean_into(items, value, new_key, level + 1)
+                continue
+
+            if isinstance(value, str):
+                if "<" in value:
+                    value = strip_html_tags(value)
+                if not value or value.isspace():
+                    value = None
+            items[new_key] = value
 
     def _flatten_json(
         self, data: dict[str, Any], parent_key: str = "", level: int = 0
@@ -113,30 +203,24 @@ class DataTransformer:
 
     def _clean_html(self, data: dict[str, Any]) -> dict[str, Any]:
         """
-        Remove HTML tags from string values.
+        Remove HTML tags from string values, in place.
 
         Args:
             data: Dictionary with potentially HTML-containing strings
 
         Returns:
-            Dictionary with cleaned strings
+            The same dictionary with cleaned strings
         """
-        cleaned = {}
-        html_pattern = re.compile(r"<.*?>")
-
         for key, value in data.items():
             if isinstance(value, str):
-                # Remove HTML tags
-                cleaned_value = html_pattern.sub("", value)
+                # Most values contain no markup; skip the regex for them
+                if "<" in value:
+                    value = data[key] = strip_html_tags(value)
                 # Convert empty strings and whitespace to None
-                if not cleaned_value or cleaned_value.isspace():
-                    cleaned[key] = None
-                else:
-                    cleaned[key] = cleaned_value
-            else:
-                cleaned[key] = value
+                if not value or value.isspace():
+                    data[key] = None
 
-        return cleaned
+        return data
 
     def _handle_lists(self, data: dict[str, Any]) -> list[dict[str, Any]]:
         """
@@ -145,60 +229,43 @@ class DataTransformer:
         - list_columns: Explode lists into multiple rows
         - list_of_dicts_columns: Split into multiple rows and flatten dict keys
 
+        Each output row is one combination of list items (in column order), built
+        with a single copy of the record instead of copying every intermediate row.
+
         Args:
             data: Dictionary with potential list values
 
         Returns:
             List of dictionaries (may be multiple rows from a single input)
         """
-        rows = [data]
-
-        # Handle list_columns first
+        # (column, is list of dicts, items); empty lists leave list_columns untouched
+        # and drop list_of_dicts_columns, like a single non-dict item would
+        expansions = []
         for list_col in self.list_columns:
-            if list_col not in data:
-                continue
-
-            value = data[list_col]
-            if not isinstance(value, list):
-                continue
-
-            # Explode list into multiple rows
-            new_rows = []
-            for row in rows:
-                if not value:  # Empty list
-                    new_rows.append(row)
-                else:
-                    for item in value:
-                        new_row = row.copy()
-                        new_row[list_col] = item
-                        new_rows.append(new_row)
-            rows = new_rows
-
-        # Handle list_of_dicts_columns
+            value = data.get(list_col)
+            if isinstance(value, list) and value:
+                expansions.append((list_col, False, value))
         for list_dict_col in self.list_of_dicts_columns:
-            if list_dict_col not in data:
-                continue
-
-            value = data[list_dict_col]
-            if not isinstance(value, list):
-                continue
-
-            # Explode list and flatten dicts
-            new_rows = []
-            for row in rows:
-                if not value:  # Empty list
-                    # Remove the list column
-                    new_row = {k: v for k, v in row.items() if k != list_dict_col}
-                    new_rows.append(new_row)
-                else:
-                    for item in value:
-                        new_row = {k: v for k, v in row.items() if k != list_dict_col}
-                        if isinstance(item, dict):
-                            # Flatten dict keys as new columns
-                            for dict_key, dict_value in item.items():
-                                new_row[f"{list_dict_col}_{dict_key}"] = dict_value
-                        new_rows.append(new_row)
-            rows = new_rows
+            value = data.get(list_dict_col)
+            if isinstance(value, list):
+                expansions.append((list_dict_col, True, value or [None]))
+
+        if not expansions:
+            return [data]
+
+        rows = []
+        for combination in itertools.product(*(items for _, _, items in expansions)):
+            row = data.copy()
+            for (column, of_dicts, _), item in zip(expansions, combination):
+                if not of_dicts:
+                    row[column] = item
+                    continue
+                row.pop(column, None)
+                if isinstance(item, dict):
+                    # Flatten dict keys as new columns
+                    for dict_key, dict_value in item.items():
+                        row[f"{column}_{dict_key}"] = dict_value
+            rows.append(row)
 
         return rows
 
@@ -210,16 +277,31 @@ class DataTransformer:
             data: Dictionary with unsanitized column names
 
         Returns:
-            Dictionary with sanitized column names
+            Dictionary with sanitized column names (data itself if no name changes)
         """
+        column_names = self._column_names
+        for key in data:
+            column = column_names.get(key)
+            if column is None:
+                column = self._cache_column_name(key)
+            if column != key:
+                break
+        else:
+            # Keys are usually valid column names already; keep the row as it is
+            return data
+
         sanitized = {}
         for key, value in data.items():
-            # Use header_normalizer to clean column names
-            clean_key = self.header_normalizer._normalize_column_name(key)
-            sanitized[clean_key] = value
+            column = column_names.get(key)
+            sanitized[self._cache_column_name(key) if column is None else column] = value
 
         return sanitized
 
+    def _cache_column_name(self, key: str) -> str:
+        """Sanitize a column name not seen before with header_normalizer and cache it."""
+        column = self._column_names[key] = self.header_normalizer._normalize_column_name(key)
+        return column
+
     def _add_output_columns(self, data: dict[str, Any]) -> dict[str, Any]:
         """
         Add required output columns: id.
@@ -230,19 +312,7 @@ class DataTransformer:
         Returns:
             Dictionary with id column added
         """
-        output = {}
-        key_columns = self.primary_keys + self.secondary_keys
-
-        id_parts = []
-        for key in key_columns:
-            value = data.get(key)
-            if value is not None:
-                id_parts.append(str(value))
-
-        output["id"] = "_".join(id_parts) if id_parts else ""
-
-        # Add all other data columns
-        for key, value in data.items():
-            output[key] = value
+        id_parts = [str(value) for value in map(data.get, self.key_columns) if value is not None]
 
-        return output
+        # id goes first; the data columns follow (a record's own id column wins)
+        return {"id": "_".join(id_parts), **data}
@@ -1,12 +1,29 @@
+import asyncio
+import csv
+import functools
+import io
+import json
+import os
+import tempfile
+import logging
+import re
 import sys
+import time
 import unittest
 from pathlib import Path
+from unittest import mock
 
 # Add src to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
+import httpx  # noqa: E402
+from freezegun import freeze_time  # noqa: E402
 from keboola.component.exceptions import UserException  # noqa: E402
+from component import Component, format_unquoted_csv  # noqa: E402
 from configuration import Configuration, RowConfiguration  # noqa: E402
+from daktela_client import REQUEST_TIMEOUT, AccessTokenFilter, AdmissionController, DaktelaApiClient  # noqa: E402
+from extractor import DaktelaExtractor  # noqa: E402
+from transformer import DataTransformer, strip_html_tags  # noqa: E402
 
 
 class TestConfiguration(unittest.TestCase):
@@ -132,6 +149,515 @@ class TestRowConfiguration(unittest.TestCase):
         self.assertIsNotNone(rows[1].fields)
         self.assertEqual(rows[2].endpoint, "tickets")
 
+    @freeze_time("2024-03-15 12:00:00")
+    def test_resolved_dates(self):
+        """Test relative dates are resolved to API datetime strings."""
+        row_config = RowConfiguration(
+            endpoint="contacts",
+            date_from="2 days ago",
+            date_to="2024-03-15"
+        )
+
+        self.assertEqual(row_config.resolved_date_from, "2024-03-13 12:00:00")
+        self.assertEqual(row_config.resolved_date_to, "2024-03-15 00:00:00")
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test resizable concurrency limiter."""
+
+    def test_limit_is_respected_after_resize(self):
+        """Test lowering the limit caps the number of concurrently admitted tasks."""
+        controller = AdmissionController(4)
+        peak = {"active": 0, "max": 0}
+
+        async def task():
+            async with controller:
+                peak["active"] += 1
+                peak["max"] = max(peak["max"], peak["active"])
+                await asyncio.sleep(0.01)
+                peak["active"] -= 1
+
+        async def run():
+            await controller.reduce_limit(60)
+            await asyncio.gather(*(task() for _ in range(10)))
+
+        asyncio.run(run())
+
+        self.assertEqual(peak["max"], 2)
+        self.assertEqual(controller.active, 0)
+
+    def test_limit_never_drops_below_one(self):
+        """Test limit is clamped to at least one slot."""
+        controller = AdmissionController(0)
+        self.assertEqual(controller.limit, 1)
+
+    def test_limit_halves_once_per_backoff_window(self):
+        """Test a burst of rate-limited requests lowers the limit only once."""
+        controller = AdmissionController(8)
+
+        async def run():
+            return [await controller.reduce_limit(60) for _ in range(3)]
+
+        self.assertEqual(asyncio.run(run()), [True, False, False])
+        self.assertEqual(controller.limit, 4)
+
+    def test_limit_recovers_after_successes(self):
+        """Test successful requests raise a reduced limit back to the initial one."""
+        controller = AdmissionController(8)
+
+        async def run():
+            await controller.reduce_limit(0)
+            await controller.reduce_limit(0)
+            for _ in range(100):
+                await controller.record_success()
+
+        asyncio.run(run())
+
+        self.assertEqual(controller.limit, 8)
+
+
+class TestRateLimitBackoff(unittest.TestCase):
+    """Test the delay before retrying a rate-limited request."""
+
+    def test_retry_after_header_is_honored(self):
+        response = httpx.Response(429, headers={"Retry-After": "3"})
+        self.assertEqual(DaktelaApiClient._rate_limit_delay(response, 0), 3.0)
+
+    def test_backoff_is_capped_with_jitter(self):
+        response = httpx.Response(429)
+        first = DaktelaApiClient._rate_limit_delay(response, 0)
+        late = DaktelaApiClient._rate_limit_delay(response, 20)
+        self.assertTrue(0.5 <= first <= 1.5)
+        self.assertTrue(30.0 <= late <= 31.0)
+
+
+class TestHttpClient(unittest.TestCase):
+    """Test the pooled HTTP client under the AsyncHttpClient wrapper."""
+
+    def test_wrapper_client_is_replaced_and_closed(self):
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret")
+
+        async def create():
+            with mock.patch("daktela_client.AsyncHttpClient") as wrapper_class:
+                default_client = httpx.AsyncClient(headers={"X-Default": "1"})
+                wrapper_class.return_value.client = default_client
+                wrapper = await client._create_http_client()
+            await wrapper.client.aclose()
+            return wrapper, default_client
+
+        wrapper, default_client = asyncio.run(create())
+
+        self.assertTrue(default_client.is_closed)
+        self.assertIs(wrapper.client, client._http_client)
+        self.assertEqual(wrapper.client.headers["X-Default"], "1")
+        self.assertEqual(wrapper.client.timeout, REQUEST_TIMEOUT)
+
+
+class TestTransientRetry(unittest.TestCase):
+    """Test retries of transient server errors."""
+
+    def test_backoff_waits_outside_the_admission_slot(self):
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret", max_concurrent=1)
+        client.access_token = "token"
+        request = httpx.Request("GET", "https://demo.daktela.com/api/v6/users.json")
+        responses = [
+            httpx.Response(503, request=request),
+            httpx.Response(200, request=request, json={"result": {"data": [], "total": 0}}),
+        ]
+
+        async def get_raw(url, params=None):
+            response = responses.pop(0)
+            response.raise_for_status()
+            return response
+
+        client.client = mock.Mock(get_raw=get_raw)
+        slots_during_backoff = []
+
+        async def fake_sleep(delay):
+            slots_during_backoff.append(client.admission.active)
+
+        with mock.patch("daktela_client.asyncio.sleep", side_effect=fake_sleep):
+            result = asyncio.run(client._get_with_token_refresh("users.json", {}, "users", 0))
+
+        self.assertEqual(result, {"result": {"data": [], "total": 0}})
+        self.assertEqual(slots_during_backoff, [0])
+
+
+class TestAccessTokenFilter(unittest.TestCase):
+    """Test masking of access tokens in log messages."""
+
+    def test_token_is_masked_in_params_and_urls(self):
+        record = logging.LogRecord(
+            "test", logging.ERROR, __file__, 0, "Params=%s url=%s",
+            ({"accessToken": "secret", "skip": 0}, "https://x/api?accessToken=secret&take=1"), None,
+        )
+        AccessTokenFilter().filter(record)
+        self.assertNotIn("secret", record.getMessage())
+        self.assertIn("'skip': 0", record.getMessage())
+
+    def test_token_is_masked_in_logged_traceback(self):
+        try:
+            raise RuntimeError("Client error for url https://x/api?accessToken=secret&take=1")
+        except RuntimeError:
+            record = logging.LogRecord(
+                "test", logging.ERROR, __file__, 0, "Unhandled error", None, sys.exc_info(),
+            )
+        AccessTokenFilter().filter(record)
+        formatted = logging.Formatter().format(record)
+        self.assertNotIn("secret", formatted)
+        self.assertIn("accessToken=***", formatted)
+
+    def test_filter_is_installed_once_per_handler(self):
+        handler = logging.StreamHandler(io.StringIO())
+        with mock.patch.object(logging.getLogger(), "handlers", [handler]), \
+                mock.patch("keboola.component.base.ComponentBase.__init__", return_value=None):
+            Component()
+            Component()
+        self.assertEqual(sum(isinstance(f, AccessTokenFilter) for f in handler.filters), 1)
+
+
+class TestTokenCache(unittest.TestCase):
+    """Test reuse of access tokens cached in the state file."""
+
+    def _enter_client(self, cached_token):
+        client = DaktelaApiClient(
+            "https://demo.daktela.com", "user", "secret", cached_token=cached_token
+        )
+
+        async def enter_and_exit():
+            async with client:
+                pass
+
+        with mock.patch.object(
+            DaktelaApiClient, "_authenticate", new=mock.AsyncMock(return_value="fresh")
+        ) as auth:
+            asyncio.run(enter_and_exit())
+        return client, auth
+
+    def test_valid_cached_token_skips_authentication(self):
+        """Test a non-expired token for the same account is reused."""
+        cached = {
+            "url": "https://demo.daktela.com",
+            "username": "user",
+            "#access_token": "cached",
+            "expires_at": time.time() + 600,
+        }
+        client, auth = self._enter_client(cached)
+
+        auth.assert_not_called()
+        self.assertEqual(client.access_token, "cached")
+        self.assertEqual(client.token_cache, cached)
+
+    def test_expired_or_foreign_token_is_ignored(self):
+        """Test expiring tokens and tokens of another account trigger authentication."""
+        base = {"url": "https://demo.daktela.com", "username": "user", "#access_token": "cached"}
+        for cached in [
+            {**base, "expires_at": time.time() + 10},
+            {**base, "username": "other", "expires_at": time.time() + 600},
+            None,
+        ]:
+            client, auth = self._enter_client(cached)
+            auth.assert_awaited_once()
+            self.assertEqual(client.access_token, "fresh")
+
+
+class TestKeysetPagination(unittest.TestCase):
+    """Test keyset pagination over the date filter field."""
+
+    def test_boundary_records_are_not_duplicated(self):
+        rows = [
+            {"name": "a", "edited": "2024-01-01"},
+            {"name": "b", "edited": "2024-01-02"},
+            {"name": "c", "edited": "2024-01-02"},
+            {"name": "d", "edited": "2024-01-03"},
+        ]
+        requests = []
+
+        async def fake_fetch_page(endpoint, params, table_name, offset):
+            requests.append(params)
+            lower = params.get("filter[0][value]", "")
+            matching = [r for r in rows if r["edited"] >= lower]
+            return matching[params["skip"]:params["skip"] + params["take"]]
+
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret")
+
+        async def collect():
+            pages = client._fetch_keyset_pages(
+                "tickets.json", {}, "tickets", "edited", "2024-01-01", "2024-12-31", 2
+            )
+            return [record["name"] async for page in pages for record in page]
+
+        with mock.patch.object(client, "_fetch_page", side_effect=fake_fetch_page):
+            names = asyncio.run(collect())
+
+        self.assertEqual(names, ["a", "b", "c", "d"])
+        self.assertEqual(requests[0]["sort"], "edited")
+        self.assertEqual(requests[1]["filter[0][value]"], "2024-01-02")
+
+    def test_ignored_filter_is_detected(self):
+        rows = [{"name": str(i)} for i in range(5)]
+
+        async def fake_fetch_page(endpoint, params, table_name, offset):
+            return rows[params["skip"]:params["skip"] + params["take"]]
+
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret")
+
+        async def collect():
+            pages = client._fetch_keyset_pages("users.json", {}, "users", "name", None, None, 2)
+            return [page async for page in pages]
+
+        with mock.patch.object(client, "_fetch_page", side_effect=fake_fetch_page):
+            with self.assertRaises(UserException):
+                asyncio.run(collect())
+
+    def test_missing_cursor_field_falls_back_to_offset(self):
+        rows = [{"id": i} for i in range(5)]
+        requests = []
+
+        async def fake_get(endpoint, params, table_name, offset):
+            requests.append(params)
+            if isinstance(params, str):
+                params = dict(httpx.QueryParams(params))
+            skip, take = int(params["skip"]), int(params["take"])
+            return {"result": {"total": len(rows), "data": rows[skip:skip + take]}}
+
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret")
+
+        async def collect():
+            pages = client.fetch_table_data_batched("queues", batch_size=2, keyset_pagination=True)
+            return sorted([record["id"] async for page in pages for record in page])
+
+        with mock.patch.object(client, "_get_with_token_refresh", side_effect=fake_get):
+            ids = asyncio.run(collect())
+
+        self.assertEqual(ids, [0, 1, 2, 3, 4])
+        self.assertEqual(requests[0]["sort"], "name")
+        self.assertNotIn("sort", requests[1])
+
+
+class TestPrefetchWindow(unittest.TestCase):
+    """Test the prefetch window shared by concurrently extracted tables."""
+
+    def test_concurrent_tables_share_the_window(self):
+        client = DaktelaApiClient("https://demo.daktela.com", "user", "secret", max_concurrent=2)
+        window = client.admission.limit * 2
+        peak = {"pages": 0}
+
+        async def fake_fetch_page(endpoint, query, table_name, offset):
+            peak["pages"] = max(peak["pages"], client._prefetched_pages)
+            await asyncio.sleep(0.001)
+            return [{"offset": offset}]
+
+        async def collect(table_name):
+            pages = client._prefetch_pages(f"{table_name}.json", {}, table_name, 20, 1)
+            return [page async for page in pages]
+
+        async def run():
+            return await asyncio.gather(*(collect(table) for table in ("tickets", "users", "contacts")))
+
+        with mock.patch.object(client, "_fetch_page", side_effect=fake_fetch_page):
+            results = asyncio.run(run())
+
+        self.assertEqual([len(pages) for pages in results], [19, 19, 19])
+        self.assertLessEqual(peak["pages"], window + 2)
+        self.assertEqual(client._prefetched_pages, 0)
+
+
+class TestWriteFailure(unittest.TestCase):
+    """Test that a failed CSV write stops the table extraction."""
+
+    def test_fetching_stops_after_write_error(self):
+        fetched = {"pages": 0}
+
+        async def fetch_table_data_batched(**kwargs):
+            for page in range(200):
+                fetched["pages"] += 1
+                yield [{"name": f"ticket{page}", "title": "x"}]
+                await asyncio.sleep(0)
+
+        api_client = mock.Mock()
+        api_client.fetch_table_data_batched = fetch_table_data_batched
+        component = mock.Mock()
+        component.awrite_table_data = mock.AsyncMock(side_effect=OSError("No space left on device"))
+        extractor = DaktelaExtractor(
+            api_client, {"tickets": {}}, component, "https://demo.daktela.com", ["tickets"]
+        )
+
+        with self.assertRaises(OSError):
+            asyncio.run(extractor._extract_table("tickets"))
+
+        self.assertLess(fetched["pages"], 10)
+        component.finalize_table.assert_not_called()
+
+
+class TestFieldProjection(unittest.TestCase):
+    """Test which fields are requested from the API."""
+
+    def _extractor(self, configured_fields=None, field_projection=True):
+        component = mock.Mock()
+        component.get_api_fields_for_endpoint.return_value = ["name", "user"]
+        component.get_schema_for_endpoint.return_value = ["id", "name", "user_name"]
+        return DaktelaExtractor(
+            mock.Mock(), {}, component, "https://demo.daktela.com", ["tickets"],
+            configured_fields=configured_fields, field_projection=field_projection,
+        )
+
+    def test_configured_fields_take_precedence(self):
+        extractor = self._extractor({"tickets": ["title"]})
+        self.assertEqual(extractor._get_fields_for_endpoint("tickets"), ["title"])
+
+    def test_state_uses_raw_api_fields_not_output_columns(self):
+        extractor = self._extractor()
+        self.assertEqual(extractor._get_fields_for_endpoint("tickets"), ["name", "user"])
+
+    def test_all_fields_are_fetched_without_projection(self):
+        extractor = self._extractor(field_projection=False)
+        self.assertIsNone(extractor._get_fields_for_endpoint("tickets"))
+
+
+class TestCsvFormatting(unittest.TestCase):
+    """Test the unquoted CSV fast path."""
+
+    def _csv_writer_output(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    def test_matches_csv_writer_for_plain_rows(self):
+        """Test fast path output is identical to csv.writer for rows without special characters."""
+        rows = [["1", "John", "", "2024-01-01 10:00:00"], ["", "", "", ""], ["2", "a b", "3.5", "True"]]
+        self.assertEqual(format_unquoted_csv(rows), self._csv_writer_output(rows))
+
+    def test_falls_back_when_quoting_needed(self):
+        """Test fields with delimiters, quotes or line breaks are left to csv.writer."""
+        for value in ["a,b", 'say "hi"', "line\nbreak", "carriage\rreturn"]:
+            self.assertIsNone(format_unquoted_csv([["1", value]]))
+
+
+class TestDataTransformer(unittest.TestCase):
+    """Test record transformation."""
+
+    def test_html_is_stripped_and_blank_values_become_none(self):
+        transformer = DataTransformer("tickets", {"primary_keys": ["name"]})
+        record = {"name": "1", "title": "<b>Hi</b> there", "note": "<p> </p>", "cmp": "a < b", "count": 3}
+        self.assertEqual(
+            list(transformer.transform_records([record])),
+            [{"id": "1", "name": "1", "title": "Hi there", "note": None, "cmp": "a < b", "count": 3}],
+        )
+
+    def test_strip_html_tags_matches_lazy_tag_regex(self):
+        """Test tags end at the nearest '>' on the same line, like re.sub(r"<.*?>", "", value)."""
+        for value in ["<b>x</b>", "a < b", "<a<b>c", "<p\n>x", "<>", "x<y\nz>w<q>", "<<<<\n>"]:
+            self.assertEqual(strip_html_tags(value), re.sub(r"<.*?>", "", value), value)
+
+    def test_strip_html_tags_is_linear_on_large_input(self):
+        """Test large and malformed inputs (unclosed '<') are handled in one pass."""
+        tagged = "<td>" + "x" * 40 + "</td>"
+        self.assertEqual(strip_html_tags(tagged * 1000), "x" * 40 * 1000)
+        unclosed = "<" * 50000
+        self.assertEqual(strip_html_tags(unclosed), unclosed)
+
+    def test_list_columns_explode_into_rows(self):
+        transformer = DataTransformer("tickets", {"list_columns": ["tags"]})
+        self.assertEqual(
+            transformer._handle_lists({"name": "1", "tags": ["a", "b", "c"]}),
+            [{"name": "1", "tags": "a"}, {"name": "1", "tags": "b"}, {"name": "1", "tags": "c"}],
+        )
+
+    def test_empty_list_column_keeps_the_record(self):
+        transformer = DataTransformer("tickets", {"list_columns": ["tags"]})
+        self.assertEqual(
+            transformer._handle_lists({"name": "1", "tags": []}), [{"name": "1", "tags": []}]
+        )
+
+    def test_list_of_dicts_columns_are_flattened_per_item(self):
+        transformer = DataTransformer("tickets", {"list_of_dicts_columns": ["contacts"]})
+        record = {"name": "1", "contacts": [{"id": 1, "mail": "x"}, "junk", {"id": 2}]}
+        self.assertEqual(
+            transformer._handle_lists(record),
+            [
+                {"name": "1", "contacts_id": 1, "contacts_mail": "x"},
+                {"name": "1"},
+                {"name": "1", "contacts_id": 2},
+            ],
+        )
+
+    def test_empty_list_of_dicts_column_is_dropped(self):
+        transformer = DataTransformer("tickets", {"list_of_dicts_columns": ["contacts"]})
+        self.assertEqual(transformer._handle_lists({"name": "1", "contacts": []}), [{"name": "1"}])
+
+    def test_both_list_kinds_produce_every_combination_in_order(self):
+        transformer = DataTransformer(
+            "tickets",
+            {"primary_keys": ["name"], "list_columns": ["tags"], "list_of_dicts_columns": ["contacts"]},
+        )
+        record = {"name": "1", "tags": ["a", "b"], "contacts": [{"id": 1}, {"id": 2}, "junk"]}
+        rows = list(transformer.transform_records([record]))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            [(row["tags"], row.get("contacts_id")) for row in rows],
+            [("a", 1), ("a", 2), ("a", None), ("b", 1), ("b", 2), ("b", None)],
+        )
+        self.assertEqual(rows[0], {"id": "1", "name": "1", "tags": "a", "contacts_id": 1})
+
+
+class TestMultiRowExtraction(unittest.TestCase):
+    """Test a full run with several row configurations."""
+
+    total = 3
+
+    def _handler(self, request):
+        if request.url.path.endswith("login.json"):
+            return httpx.Response(200, json={"result": {"accessToken": "token"}})
+        skip, take = int(request.url.params["skip"]), int(request.url.params["take"])
+        endpoint = request.url.path.rsplit("/", 1)[-1].removesuffix(".json")
+        data = [{"name": f"{endpoint}{i}", "title": "x"} for i in range(skip, min(skip + take, self.total))]
+        return httpx.Response(200, json={"result": {"total": self.total, "data": data}})
+
+    def _run(self, endpoints, advanced=None):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        data_dir = temp_dir.name
+        os.makedirs(os.path.join(data_dir, "out", "tables"))
+        config = {
+            "parameters": {
+                "connection": {"url": "https://x.daktela.com", "username": "u", "#password": "p"},
+                "advanced": advanced or {},
+            },
+            "image_parameters": [
+                {"endpoint": endpoint, "date_from": "-1 day", "date_to": "now"} for endpoint in endpoints
+            ],
+        }
+        with open(os.path.join(data_dir, "config.json"), "w") as config_file:
+            json.dump(config, config_file)
+
+        client = functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(self._handler))
+        with mock.patch.dict(os.environ, {"KBC_DATADIR": data_dir}), mock.patch("httpx.AsyncClient", client):
+            Component().run()
+        return os.path.join(data_dir, "out", "tables")
+
+    def test_rows_of_the_same_endpoint_append_to_one_table(self):
+        tables_dir = self._run(["tickets", "users", "tickets"])
+        with open(os.path.join(tables_dir, "tickets.csv")) as tickets:
+            self.assertEqual(len(list(csv.reader(tickets))), 1 + 2 * 3)
+        self.assertEqual(
+            sorted(os.listdir(tables_dir)),
+            ["tickets.csv", "tickets.csv.manifest", "users.csv", "users.csv.manifest"],
+        )
+
+    def test_concurrent_rows_extract_every_page(self):
+        self.total = 25
+        tables_dir = self._run(
+            ["tickets", "users", "activities", "contacts", "tickets"],
+            advanced={"batch_size": 2, "max_concurrent_requests": 2, "max_concurrent_endpoints": 2},
+        )
+        expected_rows = {"tickets": 2 * 25, "users": 25, "activities": 25, "contacts": 25}
+        for table, rows in expected_rows.items():
+            with open(os.path.join(tables_dir, f"{table}.csv")) as table_file:
+                names = [row[0] for row in csv.reader(table_file)][1:]
+            self.assertEqual(len(names), rows, table)
+            self.assertEqual(set(names), {f"{table}{i}" for i in range(25)}, table)
+
 
 if __name__ == "__main__":
     unittest.main()